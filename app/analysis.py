@@ -9,15 +9,26 @@
 import pandas as pd
 import html
 import os
+import sys
+import zlib
 import string
 import re
 from nltk.corpus import stopwords
+from nltk.stem import PorterStemmer
 import numpy as np
 from glob import glob
-import sparse
 from tqdm import tqdm
 import pickle
+import bisect
+import json
+import warnings
 from itertools import product
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import scipy.sparse as sps
+from sparse_matrix import DualMatrix
+from sklearn.preprocessing import normalize
+from sklearn.utils.extmath import randomized_svd
 
 STOPWORDS_SET = set(stopwords.words('english'))
 PUNCTUATION_SET = set(v for v in string.punctuation if v != "-")
@@ -26,6 +37,9 @@ PUNCTUATION_SET = PUNCTUATION_SET.union(set(['’', '‘', '•', '–', '”',
 PROD_PUNCTUATION_SET = set(''.join(tup) for k in [1,2,3] 
                          for tup in product(PUNCTUATION_SET, repeat=k))
 STOPWORDS_PUNCTUATION_SET = PROD_PUNCTUATION_SET.union(STOPWORDS_SET)
+# bump whenever clean, tokenize or remove_stopwords_and_punctuation change
+# output, so that cached tokenizations are not reused
+NORMALIZER_VERSION = '1'
 
 
 def load_descriptions_as_df(feather_filepath: str):
@@ -99,6 +113,48 @@ def read_corpus(corpus_id: str):
     return corpus_raw
 
 
+def read_source_texts(corpus_id: str, fileid_index: list):
+    ''' Returns uncleaned text of each file of ./corpus_id, in fileid order.
+    '''
+    texts = []
+    for fileid in fileid_index:
+        with open(os.path.join('.', corpus_id, fileid), 'r',
+                  encoding='utf-8') as f:
+            texts.append(f.read())
+    return texts
+
+
+def read_corpus_cached(corpus_id: str, cache):
+    ''' As read_corpus, but reuses tokenizations of unchanged files.
+
+        Only files whose content is not already in the cache are
+        cleaned, tokenized and filtered.
+
+        Args:
+            corpus_id: name of corpus directory.
+            cache: doc_cache.DocumentCache.
+
+        Returns:
+            corpus_raw, corpus_words: dicts as output by read_corpus and
+                                      get_corpus_words.
+    '''
+    search_pattern = os.path.join('.', corpus_id, '*.txt')
+    corpus_raw, corpus_words = {}, {}
+    for fp in tqdm(glob(search_pattern)):
+        with open(fp, 'r', encoding='utf-8') as f:
+            file_id = os.path.split(fp)[-1]
+            file_string = f.read()
+        key = cache.key(file_string)
+        cached = cache.get(key)
+        if cached is None:
+            file_tokens = tokenize(clean(file_string))
+            cached = (file_tokens, remove_stopwords_and_punctuation(file_tokens))
+            cache.put(key, *cached)
+        corpus_raw[file_id], corpus_words[file_id] = cached
+    cache.commit()
+    return corpus_raw, corpus_words
+
+
 def clean(file_string: str):
     ''' Cleans a string.
     '''
@@ -114,8 +170,11 @@ def clean(file_string: str):
 
 def tokenize(file_string: str):
     ''' Splits a string into tokens.
+
+        Tokens are interned, so each distinct token is held once however
+        often it occurs, across every corpus loaded in the process.
     '''
-    return [v for v in file_string.split(' ') if len(v) > 0]
+    return [sys.intern(v) for v in file_string.split(' ') if len(v) > 0]
 
 
 def get_corpus_words(corpus_raw: dict):
@@ -171,11 +230,60 @@ def cdf(X):
         Returns:
             x, P(X <= x): both numpy arrays
     '''
-    X = np.array(X)
-    step_size = (max(X) - min(X))/1e4
-    x = np.arange(min(X) - step_size, max(X) + step_size,
+    X = np.sort(X)
+    step_size = (X[-1] - X[0])/1e4
+    x = np.arange(X[0] - step_size, X[-1] + step_size,
                   step_size)
-    return x, np.array([np.mean(X <= v) for v in x])
+    # number of samples <= v is the insertion point right of v
+    return x, np.searchsorted(X, x, side='right')/len(X)
+
+
+def corpus_statistics(corpus_raw: dict, corpus_words: dict,
+                      fileid_index: list, N=100):
+    ''' Returns summaries displayed on the Corpus Specification tab.
+
+        Computed in one pass over the corpus so that figures do not each
+        need to flatten every token.
+
+        Args:
+            corpus_raw: tokenised corpus output by read_corpus.
+            corpus_words: filtered corpus output by get_corpus_words.
+            fileid_index: sorted fileids, as output by get_fileid_index.
+            N: number of most common filtered tokens to keep.
+
+        Returns:
+            dict: with keys
+                n_tokens_raw_by_file, n_tokens_filt_by_file: lists
+                    aligned with fileid_index.
+                cdf_n_tokens_raw: (x, P(X <= x)) of raw file lengths.
+                token_length_counts: pd.Series of filtered token counts
+                    indexed by token length.
+                top_token_counts: pd.Series of counts of the N most
+                    common filtered tokens.
+                n_filt_tokens: total number of filtered tokens.
+                n_unique_raw_tokens, n_unique_filt_tokens: vocabulary sizes.
+    '''
+    n_tokens_raw_by_file, n_tokens_filt_by_file = [], []
+    raw_types = set()
+    filt_token_c = Counter()
+    for fileid in fileid_index:
+        n_tokens_raw_by_file.append(len(corpus_raw[fileid]))
+        n_tokens_filt_by_file.append(len(corpus_words[fileid]))
+        raw_types.update(corpus_raw[fileid])
+        filt_token_c.update(corpus_words[fileid])
+
+    ser_token_c = pd.Series(filt_token_c)
+    return {
+        'n_tokens_raw_by_file': n_tokens_raw_by_file,
+        'n_tokens_filt_by_file': n_tokens_filt_by_file,
+        'cdf_n_tokens_raw': cdf(n_tokens_raw_by_file),
+        'token_length_counts': ser_token_c.groupby(
+                                   ser_token_c.index.str.len()).sum(),
+        'top_token_counts': ser_token_c.nlargest(N),
+        'n_filt_tokens': int(ser_token_c.sum()),
+        'n_unique_raw_tokens': len(raw_types),
+        'n_unique_filt_tokens': len(filt_token_c)
+    }
 
 
 def get_token_index(corpus_types: dict):
@@ -184,6 +292,58 @@ def get_token_index(corpus_types: dict):
     lexicon = set.union(*corpus_types.values())
     return sorted(list(lexicon))
 
+def prune_vocabulary(s_termfreq: DualMatrix, token_index: list, min_df=1,
+                     max_df=1.0, max_features=None):
+    ''' Drops the columns of s_termfreq outside document frequency limits.
+
+        Mirrors sklearn's CountVectorizer: an int min_df/max_df is a
+        number of files, a float is a fraction of files. Run after
+        merge_token_columns, so that tokens sharing a stem are kept or
+        dropped by their merged document frequency.
+
+        Args:
+            s_termfreq: term frequency matrix, e.g. from term_frequency.
+            token_index: tokens labelling the columns of s_termfreq.
+            min_df: drop tokens in fewer files than this.
+            max_df: drop tokens in more files than this.
+            max_features: keep only this many of the remaining tokens,
+                          those in most files first.
+
+        Returns:
+            s_pruned, pruned_token_index, kept, report: DualMatrix of the
+                kept columns, their tokens, np.array of their indices in
+                s_termfreq, and dict of vocabulary size and matrix
+                nonzeros before and after.
+    '''
+    n_files = s_termfreq.shape[0]
+    doc_freq = s_termfreq.n_nonzero_by_col()
+    min_count = min_df if isinstance(min_df, int) else min_df*n_files
+    max_count = max_df if isinstance(max_df, int) else max_df*n_files
+    kept = np.flatnonzero((doc_freq >= min_count) & (doc_freq <= max_count))
+    if max_features is not None and len(kept) > max_features:
+        # most frequent first, ties in column (i.e. token) order
+        kept = np.sort(kept[np.argsort(-doc_freq[kept],
+                                       kind='stable')[:max_features]])
+    report = {
+        'n_tokens_before': len(token_index),
+        'n_tokens_after': len(kept),
+        'nnz_before': int(doc_freq.sum()),
+        'nnz_after': int(doc_freq[kept].sum())
+    }
+    return (DualMatrix(s_termfreq.cols(kept)), [token_index[j] for j in kept],
+            kept, report)
+
+
+def format_pruning_report(report: dict):
+    ''' Returns pruning report output by prune_vocabulary as a string.
+    '''
+    return ('Vocabulary pruned from {:,} to {:,} tokens, matrix nonzeros '
+            'from {:,} to {:,}').format(report['n_tokens_before'],
+                                        report['n_tokens_after'],
+                                        report['nnz_before'],
+                                        report['nnz_after'])
+
+
 def get_fileid_index(corpus_types: dict):
     ''' Returns sorted fileids of corpus_types as list.
     '''
@@ -193,32 +353,32 @@ def term_frequency(corpus_types: dict,
                    corpus_words: dict,
                    fileid_index: list,
                    token_index: list):
-    ''' Returns sparse.COO of token frequencies by fileid.
+    ''' Returns DualMatrix of token frequencies by fileid.
 
-        Rows are fileids, columns are tokens.
+        Rows are fileids, columns are tokens. Tokens of corpus_words that
+        are not in token_index are ignored.
     '''
-    coords = []
-    data = []
+    rows, cols, data = [], [], []
     token_ix_dct = {t: j for j, t in enumerate(token_index)}
     for i, fileid in tqdm(list(enumerate(fileid_index))): # i is row index
-        for token in corpus_types[fileid]:
-            j = token_ix_dct[token] # j is col index
-            data.append(corpus_words[fileid].count(token))
-            coords.append((i, j))
-    
-    s_tf = sparse.COO(coords=np.array(coords).transpose(), 
-                      data=np.array(data),
-                      shape=(len(fileid_index), len(token_index)))
-    return s_tf
+        for token, count in Counter(corpus_words[fileid]).items():
+            j = token_ix_dct.get(token) # j is col index
+            if j is not None:
+                rows.append(i)
+                cols.append(j)
+                data.append(count)
 
+    return DualMatrix.from_coords(rows, cols, data,
+                                  shape=(len(fileid_index), len(token_index)))
 
-def inv_document_frequency(s_tf: sparse.COO):
-    ''' Returns sparse.COO of number of documents a token appears in.
+
+def inv_document_frequency(s_tf: DualMatrix):
+    ''' Returns np.array of inverse document frequency of each token.
 
         token: log(N) - log(number_of_files_containing_token)
     '''
-    s_invdocfreq = np.log(s_tf.shape[0]) - np.log((s_tf > 0).sum(axis=0))
-    return s_invdocfreq.todense()
+    with np.errstate(divide='ignore'): # tokens in no file have infinite idf
+        return np.log(s_tf.shape[0]) - np.log(s_tf.n_nonzero_by_col())
 
 
 def tf_idf(corpus_types: dict, corpus_words: dict,
@@ -227,25 +387,169 @@ def tf_idf(corpus_types: dict, corpus_words: dict,
     '''
     s_termfreq = term_frequency(corpus_types, corpus_words,
                                 fileid_index, token_index)
+    return s_termfreq, weight_by_idf(s_termfreq)
+
+
+def weight_by_idf(s_termfreq: DualMatrix):
+    ''' Returns DualMatrix of term frequencies weighted by their idf.
+
+        Columns may be tokens or hashed n-gram buckets.
+    '''
     m_invdocfreq = inv_document_frequency(s_termfreq) # dense for fast index
-    
+
     # nb if token doesn't appear in corpus_types[fileid] then its tf-idf is 0
-    termfreq_coords_n_data = np.vstack([s_termfreq.coords,
-                                        s_termfreq.data]).transpose()
-                                        # each row is (i, j, termfreq)
-    tfidf_coords = s_termfreq.coords
-    tfidf_data = [] # i is row (fileid) index, j is col (token) index
-    for i, j, termfreq in tqdm(termfreq_coords_n_data):
-        tfidf_data.append(termfreq*m_invdocfreq[j])
-        
-    s_tf_idf = sparse.COO(coords=np.array(tfidf_coords),
-                          data=np.array(tfidf_data),
-                          shape=(len(fileid_index), len(token_index)))
-    return s_termfreq, s_tf_idf
+    return s_termfreq.map_values(lambda data, cols: data*m_invdocfreq[cols])
+
+
+def stem_vocabulary(token_index: list, memo_filepath=None):
+    ''' Returns Porter stem of each token in token_index.
+
+        The stemmer runs once per distinct type rather than per token.
+        Stems are memoized in a JSON file at memo_filepath, if given, so
+        that later builds only stem types they have not seen before.
+    '''
+    stems = {}
+    if memo_filepath and os.path.exists(memo_filepath):
+        with open(memo_filepath, 'r', encoding='utf-8') as f:
+            stems = json.load(f)
+    new_types = [t for t in token_index if t not in stems]
+    stemmer = PorterStemmer()
+    for t in tqdm(new_types):
+        stems[t] = stemmer.stem(t)
+    if memo_filepath and new_types:
+        with open(memo_filepath, 'w', encoding='utf-8') as f:
+            json.dump(stems, f)
+    return [stems[t] for t in token_index]
+
+
+def merge_token_columns(s_termfreq: DualMatrix, token_index: list,
+                        stems: list):
+    ''' Sums the columns of s_termfreq whose tokens share a stem.
+
+        Each merged column is labelled with its most document-frequent
+        token, e.g. 'analysis' rather than its stem 'analysi', and
+        columns are sorted by label.
+
+        Args:
+            s_termfreq: term frequency matrix output by term_frequency.
+            token_index: tokens labelling the columns of s_termfreq.
+            stems: stem of each token, as output by stem_vocabulary.
+
+        Returns:
+            s_merged, merged_token_index, mapping: merged DualMatrix, its
+                sorted column labels, and np.array giving the merged
+                column of each of s_termfreq's columns.
+    ''' 
+    _, group = np.unique(stems, return_inverse=True)
+    group = group.flatten()
+
+    # label each group with its member of highest document frequency
+    order = np.lexsort((-s_termfreq.n_nonzero_by_col(), group))
+    is_first = np.r_[True, np.diff(group[order]) != 0]
+    labels = np.array(token_index, dtype=object)[order[is_first]]
+
+    # renumber groups so that labels are sorted
+    label_order = np.argsort(labels)
+    rank = np.empty_like(label_order)
+    rank[label_order] = np.arange(len(label_order))
+    mapping = rank[group]
+
+    csr = s_termfreq.csr
+    rows = np.repeat(np.arange(csr.shape[0]), np.diff(csr.indptr))
+    s_merged = DualMatrix.from_coords(rows, mapping[csr.indices], csr.data,
+                                      shape=(csr.shape[0], len(labels)))
+    return s_merged, list(labels[label_order]), mapping
+
+
+def ngram_bucket(ngram: str, n_buckets: int):
+    ''' Returns the feature column that a space-joined n-gram hashes to.
+
+        crc32 is used rather than hash() so that buckets are stable
+        across processes.
+    '''
+    return zlib.crc32(ngram.encode('utf-8')) % n_buckets
+
+
+def hashed_ngrams(tokens: list, n_buckets: int, ngram_range=(2, 3)):
+    ''' Returns bucket of every n-gram in tokens, n within ngram_range.
+    '''
+    return [ngram_bucket(' '.join(tokens[k:k+n]), n_buckets)
+            for n in range(ngram_range[0], ngram_range[1] + 1)
+            for k in range(len(tokens) - n + 1)]
+
+
+def hashed_term_frequency(corpus_words: dict, fileid_index: list,
+                          n_buckets=2**18, ngram_range=(2, 3)):
+    ''' Returns DualMatrix of hashed n-gram frequencies by fileid.
+
+        Rows are fileids, columns are hash buckets. No n-gram vocabulary
+        is kept, so the number of columns is fixed at n_buckets however
+        large the corpus grows.
+
+        Args:
+            corpus_words: tokenised corpus output by get_corpus_words.
+            fileid_index: sorted fileids, as output by get_fileid_index.
+            n_buckets: number of hash buckets (feature columns).
+            ngram_range: (min_n, max_n) n-gram lengths to include.
+
+        Returns:
+            s_ngram_tf, n_ngrams: DualMatrix and total number of n-grams
+                                  hashed (used by ngram_collision_report).
+    '''
+    rows, cols, data = [], [], []
+    n_ngrams = 0
+    for i, fileid in tqdm(list(enumerate(fileid_index))):
+        buckets = hashed_ngrams(corpus_words[fileid], n_buckets, ngram_range)
+        n_ngrams += len(buckets)
+        file_cols, file_counts = np.unique(buckets, return_counts=True)
+        rows.append(np.full(len(file_cols), i))
+        cols.append(file_cols)
+        data.append(file_counts)
+
+    s_ngram_tf = DualMatrix.from_coords(np.concatenate(rows),
+                                        np.concatenate(cols),
+                                        np.concatenate(data),
+                                        shape=(len(fileid_index), n_buckets))
+    return s_ngram_tf, n_ngrams
+
+
+def ngram_collision_report(s_ngram_tf: DualMatrix, n_ngrams: int):
+    ''' Returns dict summarising hash collisions in s_ngram_tf.
+
+        The number of distinct n-grams is estimated from bucket occupancy
+        by linear counting, n = -m*log(1 - occupied/m), so that no n-gram
+        vocabulary needs to be held in memory.
+    '''
+    n_buckets = s_ngram_tf.shape[1]
+    n_occupied = int(np.count_nonzero(s_ngram_tf.n_nonzero_by_col()))
+    if n_occupied < n_buckets:
+        n_distinct = -n_buckets*np.log(1 - n_occupied/n_buckets)
+    else:
+        n_distinct = np.inf # saturated, every bucket has collided
+    return {
+        'n_buckets': n_buckets,
+        'n_ngrams': n_ngrams,
+        'n_occupied_buckets': n_occupied,
+        'est_n_distinct_ngrams': float(n_distinct),
+        # fraction of distinct n-grams sharing their bucket with another,
+        # assuming buckets fill as a Poisson process
+        'est_collision_rate': float(1 - np.exp(-n_distinct/n_buckets))
+    }
+
+
+def format_ngram_report(report: dict):
+    ''' Returns collision report output by ngram_collision_report as a
+        string.
+    '''
+    return ('{:,} n-grams hashed into {:,} of {:,} buckets: ~{:,.0f} '
+            'distinct n-grams, ~{:.1%} sharing a bucket').format(
+                report['n_ngrams'], report['n_occupied_buckets'],
+                report['n_buckets'], report['est_n_distinct_ngrams'],
+                report['est_collision_rate'])
 
 
 def similar_words(query_word: str, token_i: dict, token_index: list,
-                  s_tfidf: sparse.COO, N=10):
+                  s_tfidf: DualMatrix, N=10):
     ''' Returns words that are specific to documents that containing the query word.
     '''
     try:
@@ -254,20 +558,23 @@ def similar_words(query_word: str, token_i: dict, token_index: list,
     except KeyError as e:
         raise KeyError('0 files feature query word \'{}\''.format(query_word))
     else:
-        fileid_ix = s_tfidf[:, j].coords.flatten() # list of relevant file ix
+        fileid_ix, _ = s_tfidf.col(j) # list of relevant file ix
 
         # within these files, compute mean tf-idf for all tokens
-        s_tfidf_sub = s_tfidf[fileid_ix, :] 
-        m_mean_tfidf = s_tfidf_sub.mean(axis=0).todense() # for each token
+        s_tfidf_sub = s_tfidf.rows(fileid_ix)
+        m_mean_tfidf = np.asarray(s_tfidf_sub.mean(axis=0)).flatten() # for each token
 
         # get number of files in corpus
         n_files_in_corpus = s_tfidf.shape[0]
 
-        # get number of files with term
-        m_files_with_term = (s_tfidf > 0).sum(axis=0).todense()
+        # get number of files with term; tokens featured in every file have
+        # idf 0, so files are counted by stored entries, not positive values
+        m_files_with_term = s_tfidf.n_stored_by_col()
 
         # compute incidence of these tokens in files where query_word appears
-        m_term_inc_sub = 100.*((s_tfidf_sub > 0).mean(axis=0).todense())
+        m_term_inc_sub = 100.*(np.bincount(s_tfidf_sub.indices,
+                                           minlength=s_tfidf.shape[1])
+                               /len(fileid_ix))
 
         # compute incidence of tokens in all files
         m_term_inc = 100.*(m_files_with_term/n_files_in_corpus)
@@ -285,22 +592,406 @@ def similar_words(query_word: str, token_i: dict, token_index: list,
         return df.nlargest(n=N, columns='Score')
         
 
-def jacard_index(s_tf: sparse.COO, fileid: str, fileid_i: dict, fileid_index: list):
+def token_associations(s_tfidf: DualMatrix, top_n=100, block_size=None):
+    ''' Returns thresholded token-token association matrices.
+
+        For each token j, keeps the top_n tokens by mean tf-idf across the
+        files containing j, together with their co-occurrence counts. A
+        similar_words query then reduces to reading row j.
+
+        Args:
+            s_tfidf: tf-idf matrix output by tf_idf.
+            top_n: number of associated tokens kept per token.
+            block_size: tokens per sparse matrix product. Defaults to a
+                        block of roughly 2**22 associations.
+
+        Returns:
+            dict: with keys
+                score: CSR (n_tokens, n_tokens) mean tf-idf of column token
+                       in files containing row token.
+                count: CSR of the same shape and sparsity, number of files
+                       containing both tokens.
+                n_files_w_token: np.array, document frequency of each token.
+                n_files: number of files in corpus.
+    '''
+    T = s_tfidf.csr
+    # incidence matrix, from the stored entries rather than positive values,
+    # so that tokens featured in every file (idf 0) are counted too
+    B = sps.csr_matrix((np.ones(T.nnz, dtype=np.float32), T.indices,
+                        T.indptr), shape=T.shape)
+    Bt = B.T.tocsr()
+    n_files, n_tokens = T.shape
+    n_files_w_token = s_tfidf.n_stored_by_col()
+    if block_size is None:
+        block_size = max(1, 2**22 // n_tokens)
+
+    indptr, indices, scores, counts = [0], [], [], []
+    for start in tqdm(range(0, n_tokens, block_size)):
+        Bt_block = Bt[start:start + block_size]
+        m_sum = Bt_block @ T
+        m_count = Bt_block @ B
+        m_sum.sort_indices()
+        m_count.sort_indices()
+        for r in range(m_sum.shape[0]):
+            # co-occurring tokens are taken from the counts, as the product
+            # drops sums of 0, e.g. of tokens featured in every file
+            cols = m_count.indices[m_count.indptr[r]:m_count.indptr[r+1]]
+            count_vals = m_count.data[m_count.indptr[r]:m_count.indptr[r+1]]
+            sum_cols = m_sum.indices[m_sum.indptr[r]:m_sum.indptr[r+1]]
+            vals = np.zeros(len(cols), dtype=m_sum.dtype)
+            vals[np.searchsorted(cols, sum_cols)] = \
+                m_sum.data[m_sum.indptr[r]:m_sum.indptr[r+1]]
+            if len(cols) > top_n:
+                keep = np.sort(np.argpartition(-vals, top_n - 1)[:top_n])
+                cols, vals = cols[keep], vals[keep]
+                count_vals = count_vals[keep]
+            indices.append(cols)
+            scores.append(vals/max(n_files_w_token[start + r], 1))
+            counts.append(count_vals)
+            indptr.append(indptr[-1] + len(cols))
+
+    shape = (n_tokens, n_tokens)
+    indices, indptr = np.concatenate(indices), np.array(indptr)
+    return {
+        'score': sps.csr_matrix((np.concatenate(scores), indices, indptr),
+                                shape=shape),
+        'count': sps.csr_matrix((np.concatenate(counts), indices, indptr),
+                                shape=shape),
+        'n_files_w_token': n_files_w_token,
+        'n_files': n_files
+    }
+
+
+def similar_words_precomputed(query_word: str, token_i: dict,
+                              token_index: list, token_assoc: dict, N=10):
+    ''' As similar_words, but reads the query word's row of token_assoc.
+
+        N must not exceed the top_n token_assoc was built with.
+    '''
+    try:
+        j = token_i[query_word]
+    except KeyError as e:
+        raise KeyError('0 files feature query word \'{}\''.format(query_word))
+    else:
+        row = slice(token_assoc['score'].indptr[j],
+                    token_assoc['score'].indptr[j+1])
+        cols = token_assoc['score'].indices[row]
+        m_files_with_term = token_assoc['n_files_w_token'][cols]
+        df = pd.DataFrame({
+            'Token': [token_index[c] for c in cols],
+            'Score': token_assoc['score'].data[row],
+            '% of keyword files w token': 100.*(
+                token_assoc['count'].data[row]
+                / max(token_assoc['n_files_w_token'][j], 1)),
+            '# of files w token': m_files_with_term.astype(int),
+            '% of files w token': 100.*(m_files_with_term
+                                        / token_assoc['n_files'])
+        })
+        return df.nlargest(n=N, columns='Score')
+
+
+def top_k_by_row(s_tfidf: DualMatrix, k=20):
+    ''' Returns the columns of each row's k largest values, e.g. each file's
+        most distinguishing tokens.
+
+        Built in one pass over the stored entries: they are sorted by row
+        and descending value, and the first k of each row are scattered
+        into fixed-width arrays. Ties keep column order, as nlargest does.
+
+        Returns:
+            ix, values: (n_rows, k) int32 and float32 arrays, largest
+                        first; rows with fewer than k entries are padded
+                        with column -1 and value 0.
+    '''
+    m = s_tfidf.csr
+    rows = np.repeat(np.arange(m.shape[0]), np.diff(m.indptr))
+    order = np.lexsort((-m.data, rows)) # stable, so ties keep column order
+    rank = np.arange(m.nnz) - m.indptr[rows[order]]
+    keep = order[rank < k]
+    ix = np.full((m.shape[0], k), -1, dtype=np.int32)
+    values = np.zeros((m.shape[0], k), dtype=np.float32)
+    ix[rows[keep], rank[rank < k]] = m.indices[keep]
+    values[rows[keep], rank[rank < k]] = m.data[keep]
+    return ix, values
+
+
+def complete_prefix(prefix: str, token_index, n_files_w_token, N=10):
+    ''' Returns up to N tokens starting with prefix, most frequent first.
+
+        Matching tokens are a contiguous range of the sorted token_index,
+        found by bisection, so only that range is ranked.
+
+        Args:
+            prefix: start of a token.
+            token_index: sorted tokens, e.g. Backend.Data.token_index.
+            n_files_w_token: number of files featuring each token, e.g.
+                             Backend.Data.n_files_w_token.
+            N: maximum number of suggestions.
+    '''
+    if not prefix:
+        return []
+    lo = bisect.bisect_left(token_index, prefix)
+    hi = bisect.bisect_left(token_index, prefix + '\U0010ffff', lo)
+    counts = np.asarray(n_files_w_token[lo:hi])
+    top = np.arange(len(counts))
+    if len(counts) > N:
+        top = np.argpartition(-counts, N - 1)[:N]
+    top = top[np.lexsort((top, -counts[top]))] # ties in alphabetical order
+    return [token_index[lo + j] for j in top]
+
+
+def keyword_profiles(keywords: list, token_i: dict, token_index: list,
+                     s_tfidf: DualMatrix, N=10):
+    ''' Returns similar_words tables for many keywords at once.
+
+        Builds a file x keyword indicator matrix K from the keywords'
+        columns of s_tfidf, so that K.T @ s_tfidf gives every keyword's
+        summed tf-idf profile in one sparse matrix product.
+
+        Args:
+            keywords: query words. Words not in the corpus are skipped
+                      with a warning.
+            token_i, token_index, s_tfidf: as for similar_words.
+            N: number of tokens kept per keyword.
+
+        Returns:
+            pd.DataFrame: one row per (keyword, token), with the columns
+                of similar_words plus 'Keyword' and '# of keyword files'.
+    '''
+    missing = [k for k in keywords if k not in token_i]
+    if missing:
+        warnings.warn('0 files feature keywords {}'.format(missing))
+    keywords = [k for k in keywords if k in token_i]
+
+    K = s_tfidf.cols([token_i[k] for k in keywords]).tocsr()
+    K.data[:] = 1 # files featuring each keyword
+    Kt = K.T.tocsr()
+    n_kw_files = np.maximum(np.diff(Kt.indptr), 1)
+    B = s_tfidf.csr.copy()
+    B.data[:] = 1 # incidence matrix, of stored entries as in similar_words
+    m_files_with_term = s_tfidf.n_stored_by_col()
+    n_files_in_corpus = s_tfidf.shape[0]
+
+    dfs = []
+    block_size = max(1, 2**22 // s_tfidf.shape[1])
+    for start in range(0, len(keywords), block_size):
+        Kt_block = Kt[start:start + block_size]
+        m_n_kw = n_kw_files[start:start + block_size, None]
+        m_mean_tfidf = (Kt_block @ s_tfidf.csr).toarray()/m_n_kw
+        m_term_inc_sub = 100.*(Kt_block @ B).toarray()/m_n_kw
+        for r in range(Kt_block.shape[0]):
+            # top n, ties at the nth value kept in column order as by
+            # similar_words' nlargest
+            n = min(N, len(token_index))
+            scores = m_mean_tfidf[r]
+            nth = -np.partition(-scores, n - 1)[n - 1]
+            above = np.flatnonzero(scores > nth)
+            top = np.concatenate([above, np.flatnonzero(
+                                    scores == nth)[:n - len(above)]])
+            top = top[np.lexsort((top, -scores[top]))]
+            dfs.append(pd.DataFrame({
+                'Keyword': keywords[start + r],
+                '# of keyword files': int(m_n_kw[r, 0]),
+                'Token': [token_index[j] for j in top],
+                'Score': m_mean_tfidf[r, top],
+                '% of keyword files w token': m_term_inc_sub[r, top],
+                '# of files w token': m_files_with_term[top],
+                '% of files w token': 100.*(m_files_with_term[top]
+                                            /n_files_in_corpus)
+            }))
+    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+
+
+def write_keyword_profiles(df_profiles: pd.DataFrame, filepath: str):
+    ''' Writes output of keyword_profiles to a .feather or .csv file.
+    '''
+    if filepath.endswith('.feather'):
+        df_profiles.reset_index(drop=True).to_feather(filepath)
+    else:
+        df_profiles.to_csv(filepath, index=False)
+
+
+def jacard_index(s_tf: DualMatrix, fileid: str, fileid_i: dict, fileid_index: list):
     ''' Returns Jacard index Series for file 'fileid'.
     '''
     # get word incidence matrix
-    s_inc = (s_tf > 0) # word incidence matrix
+    s_inc = (s_tf.csr > 0).astype(np.float32) # word incidence matrix
 
     # compute Jacard index - types_shared/total_types (betw. two files)
     i = fileid_i[fileid]
-    s_inc_row_stretched = s_inc[i, :]*sparse.ones(shape=s_inc.shape)
-    tmp = np.stack([s_inc, s_inc_row_stretched], axis=-1)
-    types_in_intersection = tmp.min(axis=-1).sum(axis=1)
-    types_in_union = tmp.max(axis=-1).sum(axis=1)
+    types_in_intersection = (s_inc @ s_inc[i].T).toarray().flatten()
+    types_in_file = s_tf.n_nonzero_by_row()
+    types_in_union = types_in_file + types_in_file[i] - types_in_intersection
     # nb a 'type' is an element of set(list_of_tokens)
-    m_ji = types_in_intersection.todense()/types_in_union.todense()
+    m_ji = types_in_intersection/types_in_union
 
     # cast to Series
     ser_ji = pd.Series(m_ji, index=fileid_index)
     
     return ser_ji.sort_values(ascending=False)
+
+
+def l2_normalize(s_tfidf: DualMatrix):
+    ''' Returns scipy CSR copy of s_tfidf with unit-length rows.
+
+        Dot products between rows of the result are cosine similarities.
+    '''
+    return normalize(s_tfidf.csr)
+
+
+def top_k_cosine(X_norm: sps.csr_matrix, rows, k=20, exclude_self=True):
+    ''' Returns the k rows of X_norm most cosine-similar to each row in rows.
+
+        Args:
+            X_norm: L2-normalized CSR matrix output by l2_normalize.
+            rows: sequence of row indices to query.
+            k: number of neighbours to return for each query row.
+            exclude_self: whether a row may appear among its own neighbours.
+
+        Returns:
+            ix, scores: (len(rows), k) numpy arrays of neighbour row indices
+                        and cosine similarities, most similar first.
+    '''
+    rows = np.asarray(rows)
+    k = min(k, X_norm.shape[0] - int(exclude_self))
+    m_sim = (X_norm[rows] @ X_norm.T).toarray() # dense (len(rows), n_files)
+    if exclude_self:
+        m_sim[np.arange(len(rows)), rows] = -np.inf
+    ix = np.argpartition(-m_sim, kth=k-1, axis=1)[:, :k]
+    scores = np.take_along_axis(m_sim, ix, axis=1)
+    order = np.argsort(-scores, axis=1) # argpartition leaves top k unsorted
+    return (np.take_along_axis(ix, order, axis=1).astype(np.int32),
+            np.take_along_axis(scores, order, axis=1).astype(np.float32))
+
+
+def nearest_neighbours(X_norm: sps.csr_matrix, k=20, block_size=None,
+                       n_jobs=None):
+    ''' Returns the k nearest neighbours of every row of X_norm.
+
+        Rows are processed in blocks so that at most block_size x n_files
+        similarities are held in memory per worker thread; blocks are
+        spread across a thread pool.
+
+        Args:
+            X_norm: L2-normalized CSR matrix output by l2_normalize.
+            k: number of neighbours to store for each row.
+            block_size: rows per sparse matrix product. Defaults to a
+                        block of roughly 2**22 similarities.
+            n_jobs: number of worker threads (None lets the pool decide).
+
+        Returns:
+            ix, scores: (n_files, k) numpy arrays as for top_k_cosine.
+    '''
+    n = X_norm.shape[0]
+    if block_size is None:
+        block_size = max(1, 2**22 // n)
+    blocks = [np.arange(start, min(start + block_size, n))
+              for start in range(0, n, block_size)]
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        results = list(tqdm(pool.map(lambda rows: top_k_cosine(X_norm, rows, k),
+                                     blocks), total=len(blocks)))
+    return (np.vstack([ix for ix, _ in results]),
+            np.vstack([scores for _, scores in results]))
+
+
+def similar_files(fileid: str, fileid_i: dict, fileid_index: list,
+                  X_norm: sps.csr_matrix, k=20, neighbours=None):
+    ''' Returns Series of the k files most cosine-similar to 'fileid'.
+
+        Uses precomputed neighbours (output of nearest_neighbours) when
+        given, otherwise scores fileid against the whole corpus.
+    '''
+    i = fileid_i[fileid]
+    if neighbours is not None and neighbours[0].shape[1] >= k:
+        ix, scores = neighbours[0][i, :k], neighbours[1][i, :k]
+    else:
+        ix, scores = top_k_cosine(X_norm, [i], k)
+        ix, scores = ix[0], scores[0]
+    return pd.Series(scores, index=[fileid_index[j] for j in ix])
+
+
+def svd_embedding(X_norm: sps.csr_matrix, n_components=2, n_iter=5,
+                  random_state=0):
+    ''' Returns a low-dimensional embedding of the rows of X_norm.
+
+        Fits a randomized truncated SVD, which only multiplies X_norm by
+        thin dense matrices, so its cost grows linearly with the number of
+        files rather than needing a dense copy.
+
+        Args:
+            X_norm: L2-normalized CSR matrix output by l2_normalize.
+            n_components: dimensions of the embedding.
+            n_iter: power iterations, trading time for accuracy.
+            random_state: seed, so rebuilds give the same embedding.
+
+        Returns:
+            components, coords: (n_components, n_tokens) and
+                                (n_files, n_components) float32 arrays.
+    '''
+    _, _, components = randomized_svd(X_norm, n_components, n_iter=n_iter,
+                                      random_state=random_state)
+    components = components.astype(np.float32)
+    return components, embed_documents(X_norm, components)
+
+
+def embed_documents(X_norm: sps.csr_matrix, components: np.ndarray):
+    ''' Returns coordinates of rows of X_norm in an svd_embedding.
+
+        New documents, e.g. vectorized by classify.RoleClassifier.vectorize,
+        are folded into an existing embedding without refitting it.
+    '''
+    return np.asarray(X_norm @ components.T, dtype=np.float32)
+
+
+def downsample_points(coords: np.ndarray, max_points=5000, x_range=None,
+                      y_range=None, n_bins=64, random_state=0):
+    ''' Returns indices of at most max_points of coords, thinned by density.
+
+        Points within x_range and y_range (default: all) are binned on an
+        n_bins x n_bins grid and every cell keeps at most the same number
+        of points, so dense clusters are thinned while sparse regions and
+        outliers are kept whole. Points are kept in a fixed random order,
+        so zooming in only adds points to those already shown.
+
+        Args:
+            coords: (n_points, 2) array.
+            max_points: maximum number of indices to return.
+            x_range, y_range: [min, max] of the visible region, or None.
+            n_bins: grid cells per axis.
+            random_state: seed of the order in which points are kept.
+    '''
+    x, y = coords[:, 0], coords[:, 1]
+    in_view = np.ones(len(coords), dtype=bool)
+    if x_range is not None:
+        in_view &= (x >= min(x_range)) & (x <= max(x_range))
+    if y_range is not None:
+        in_view &= (y >= min(y_range)) & (y <= max(y_range))
+    ix = np.flatnonzero(in_view)
+    if len(ix) <= max_points:
+        return ix
+
+    # assign each point in view a grid cell, at most one cell per kept point
+    n_bins = min(n_bins, int(np.sqrt(max_points)))
+    def bin_of(v):
+        lo, hi = v.min(), v.max()
+        return np.minimum(((v - lo)/((hi - lo) or 1)*n_bins).astype(np.int64),
+                          n_bins - 1)
+    cell = bin_of(x[ix])*n_bins + bin_of(y[ix])
+
+    # rank points within their cell by a fixed priority
+    priority = np.random.RandomState(random_state).permutation(len(coords))[ix]
+    order = np.lexsort((priority, cell))
+    cell_counts = np.bincount(cell, minlength=n_bins*n_bins)
+    cell_starts = np.concatenate([[0], np.cumsum(cell_counts)[:-1]])
+    rank = np.arange(len(ix)) - cell_starts[cell[order]]
+
+    # largest per-cell cap whose total fits max_points
+    lo, hi = 0, int(cell_counts.max())
+    while lo < hi:
+        cap = (lo + hi + 1)//2
+        if np.minimum(cell_counts, cap).sum() <= max_points:
+            lo = cap
+        else:
+            hi = cap - 1
+    return np.sort(ix[order[rank < lo]])
+
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: versioned on-disk store of Backend.Data attributes as .npy
+#          files, loaded by memory mapping instead of unpickling.
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+from sparse_matrix import DualMatrix
+from collections.abc import Mapping, Sequence
+from glob import glob
+import bisect
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# bump whenever Backend.Data's attributes change, so stores are rebuilt
+PIPELINE_VERSION = '9'
+TOKEN_ATTRS = ['corpus_raw', 'corpus_words'] # fileid -> list of tokens
+INDEX_ATTRS = ['token_i', 'fileid_i'] # str -> int
+DERIVED_ATTRS = ['corpus_types'] # rebuilt from corpus_words on load
+
+
+def corpus_hash(corpus_id: str):
+    ''' Returns sha1 hex digest of the names and contents of ./corpus_id/*.txt.
+    '''
+    h = hashlib.sha1()
+    for fp in sorted(glob(os.path.join('.', corpus_id, '*.txt'))):
+        h.update(os.path.split(fp)[-1].encode('utf-8'))
+        with open(fp, 'rb') as f:
+            h.update(hashlib.sha1(f.read()).digest())
+    return h.hexdigest()
+
+
+def version(corpus_hash: str, options: dict):
+    ''' Returns sha1 hex digest identifying a build of a corpus, e.g. to
+        key caches of results computed from it.
+    '''
+    return hashlib.sha1(json.dumps([PIPELINE_VERSION, corpus_hash, options],
+                                   sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class StringArray(Sequence):
+    ''' Read-only list of strings stored as one UTF-8 buffer plus offsets.
+    '''
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def encode(cls, strings):
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(blob, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self.blob[self.offsets[i]:self.offsets[i+1]].tobytes().decode(
+                    'utf-8')
+
+
+class StringIndex(Mapping):
+    ''' Read-only dict from string to int, looked up by bisection.
+
+        keys must be a sorted StringArray, values an array aligned with it.
+    '''
+
+    def __init__(self, keys: StringArray, values):
+        self.keys_ = keys
+        self.values_ = values
+
+    def __getitem__(self, key):
+        k = bisect.bisect_left(self.keys_, key)
+        if k == len(self.keys_) or self.keys_[k] != key:
+            raise KeyError(key)
+        return int(self.values_[k])
+
+    def __iter__(self):
+        return iter(self.keys_)
+
+    def __len__(self):
+        return len(self.keys_)
+
+
+class TokenLists(Mapping):
+    ''' Read-only dict from fileid to list of tokens.
+
+        Tokens are stored as int32 ids into vocab, concatenated across
+        files and split by offsets; lists are decoded on access.
+    '''
+
+    def __init__(self, fileids: StringIndex, vocab: StringArray, ids, offsets):
+        self.fileids = fileids
+        self.vocab = vocab
+        self.ids = ids
+        self.offsets = offsets
+
+    def __getitem__(self, fileid):
+        k = self.fileids[fileid]
+        return [self.vocab[j] for j in self.ids[self.offsets[k]:self.offsets[k+1]]]
+
+    def __iter__(self):
+        return iter(self.fileids)
+
+    def __len__(self):
+        return len(self.fileids)
+
+
+class TypeSets(Mapping):
+    ''' Read-only dict from fileid to set of tokens, derived on access.
+    '''
+
+    def __init__(self, corpus_words: Mapping):
+        self.corpus_words = corpus_words
+
+    def __getitem__(self, fileid):
+        return set(self.corpus_words[fileid])
+
+    def __iter__(self):
+        return iter(self.corpus_words)
+
+    def __len__(self):
+        return len(self.corpus_words)
+
+
+class DocumentBlob:
+    ''' Read-only store of each file's views as one UTF-8 buffer.
+
+        The views of a file are its source text and its raw and filtered
+        tokens joined by ', '. View k of file i is
+        blob[offsets[i, k]:offsets[i, k+1]], so reading any part of a
+        document is one slice, however long it or the corpus is.
+    '''
+
+    VIEWS = ['text', 'raw_tokens', 'filtered_tokens']
+
+    def __init__(self, fileids: Mapping, blob, offsets):
+        self.fileids = fileids
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def encode(cls, fileid_index: list, texts: list, corpus_raw: Mapping,
+               corpus_words: Mapping):
+        ''' Builds store from source texts aligned with fileid_index.
+        '''
+        chunks = [s.encode('utf-8') for fid, text in zip(fileid_index, texts)
+                  for s in [text, ', '.join(corpus_raw[fid]),
+                            ', '.join(corpus_words[fid])]]
+        n_views = len(cls.VIEWS)
+        ends = np.cumsum([len(c) for c in chunks]).reshape(-1, n_views)
+        offsets = np.zeros((len(fileid_index), n_views + 1), dtype=np.int64)
+        offsets[:, 1:] = ends
+        offsets[1:, 0] = ends[:-1, -1]
+        return cls({fid: i for i, fid in enumerate(fileid_index)},
+                   np.frombuffer(b''.join(chunks), dtype=np.uint8), offsets)
+
+    def get(self, fileid: str, view='text', start=0, max_bytes=None):
+        ''' Returns (text, next_start) of a page of fileid's view.
+
+            The page is the view's bytes from start, at most max_bytes of
+            them (default: all). next_start is where the following page
+            begins, or None if this page reaches the end of the view.
+        '''
+        i, k = self.fileids[fileid], self.VIEWS.index(view)
+        begin = self.offsets[i, k] + start
+        end = self.offsets[i, k+1]
+        if max_bytes is not None and begin + max_bytes < end:
+            stop = begin + max_bytes
+            # pages end on whole characters
+            while stop > begin and self.blob[stop] & 0xC0 == 0x80:
+                stop -= 1
+            return (self.blob[begin:stop].tobytes().decode('utf-8'),
+                    int(stop - self.offsets[i, k]))
+        return self.blob[begin:end].tobytes().decode('utf-8'), None
+
+
+class ArtifactStore:
+    ''' Directory of builds, each a directory of .npy files holding the
+        attributes of a Backend.Data.
+
+        A build's manifest.json records, for each attribute, how it was
+        stored, along with the corpus hash, pipeline version and build
+        options it was built from. Each save writes a new build and then
+        atomically replaces the CURRENT file naming it, so a store is only
+        used once complete, and a build is never overwritten while it is
+        read. Arrays are loaded with mmap_mode='r', so loading does not
+        copy them into memory.
+    '''
+
+    def __init__(self, root: str):
+        self.root = root
+        self.current_filepath = os.path.join(root, 'CURRENT')
+        self.__dir = None # build read or written, set by load and save
+
+
+    def build_dir(self):
+        ''' Returns directory of the current build, None if none was saved.
+        '''
+        try:
+            with open(self.current_filepath, 'r') as f:
+                return os.path.join(self.root, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+
+    def manifest(self, build_dir=None):
+        build_dir = build_dir or self.build_dir()
+        if build_dir is None:
+            return None
+        try:
+            with open(os.path.join(build_dir, 'manifest.json'), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+
+    def is_current(self, corpus_hash: str, options: dict):
+        ''' Whether the store was built from this corpus, pipeline and options.
+        '''
+        manifest = self.manifest()
+        return (manifest is not None
+                and manifest['pipeline_version'] == PIPELINE_VERSION
+                and manifest['corpus_hash'] == corpus_hash
+                # compared as JSON, as 1 (file) and 1.0 (of files) differ
+                and json.dumps(manifest['options'], sort_keys=True)
+                    == json.dumps(options, sort_keys=True))
+
+
+    def save(self, attrs: dict, corpus_hash: str, options: dict,
+             figures=None):
+        ''' Saves attrs, e.g. data.public_attributes(), as a new build and
+            makes it current.
+
+            figures, if given, is a dict of plotly figures as JSON
+            compatible dicts, e.g. from Backend.render_figures. Builds
+            older than the previous one are then removed where possible;
+            the previous one is kept for readers that read CURRENT before
+            it was replaced, and removal fails harmlessly on Windows while
+            another process still maps the files.
+        '''
+        previous_dir = self.build_dir()
+        os.makedirs(self.root, exist_ok=True)
+        self.__dir = tempfile.mkdtemp(prefix='build-', dir=self.root)
+        build = os.path.basename(self.__dir)
+        entries = {}
+        for name, value in attrs.items():
+            if name in DERIVED_ATTRS:
+                continue
+            elif name in TOKEN_ATTRS:
+                entries[name] = self.__save_tokens(name, value)
+            elif name in INDEX_ATTRS:
+                entries[name] = self.__save_index(name, value)
+            else:
+                entries[name] = self.__save(name, value)
+        if figures:
+            with open(os.path.join(self.__dir, 'figures.json'), 'w') as f:
+                json.dump(figures, f)
+        with open(os.path.join(self.__dir, 'manifest.json'), 'w') as f:
+            json.dump({'pipeline_version': PIPELINE_VERSION,
+                       'corpus_hash': corpus_hash,
+                       'options': options,
+                       'attrs': entries}, f)
+        tmp_filepath = '{}.{}'.format(self.current_filepath, build)
+        with open(tmp_filepath, 'w') as f:
+            f.write(build)
+        os.replace(tmp_filepath, self.current_filepath)
+        keep = {'CURRENT', build, os.path.basename(previous_dir or '')}
+        for name in os.listdir(self.root):
+            if name in keep or name.startswith('CURRENT.'):
+                continue
+            filepath = os.path.join(self.root, name)
+            if os.path.isdir(filepath):
+                shutil.rmtree(filepath, ignore_errors=True)
+            else:
+                try:
+                    os.remove(filepath) # files of stores before builds
+                except OSError:
+                    pass
+
+
+    def load(self):
+        ''' Returns dict of attributes of the current build, arrays memory
+            mapped read-only.
+        '''
+        self.__dir = self.build_dir()
+        entries = self.manifest(self.__dir)['attrs']
+        attrs = {name: self.__load(entry) for name, entry in entries.items()}
+        if 'corpus_words' in attrs:
+            attrs['corpus_types'] = TypeSets(attrs['corpus_words'])
+        return attrs
+
+
+    def load_figures(self):
+        ''' Returns dict of figures saved with the build last loaded (or
+            else the current one), if any.
+        '''
+        build_dir = self.__dir or self.build_dir()
+        if build_dir is None:
+            return {}
+        try:
+            with open(os.path.join(build_dir, 'figures.json'), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+
+    def __path(self, name: str):
+        return os.path.join(self.__dir, name + '.npy')
+
+
+    def __save_array(self, name: str, array):
+        np.save(self.__path(name), np.asarray(array))
+        return name
+
+
+    def __load_array(self, name: str):
+        return np.load(self.__path(name), mmap_mode='r')
+
+
+    def __save_strings(self, name: str, strings):
+        s = StringArray.encode(strings)
+        return {'kind': 'strings',
+                'blob': self.__save_array(name + '.blob', s.blob),
+                'offsets': self.__save_array(name + '.offsets', s.offsets)}
+
+
+    def __save_index(self, name: str, dct: dict):
+        keys = sorted(dct.keys())
+        return {'kind': 'index',
+                'keys': self.__save_strings(name + '.keys', keys),
+                'values': self.__save_array(name + '.values',
+                                            [dct[k] for k in keys])}
+
+
+    def __save_tokens(self, name: str, dct: dict):
+        fileids = sorted(dct.keys())
+        vocab_i = {}
+        ids = np.array([vocab_i.setdefault(t, len(vocab_i))
+                        for fid in fileids for t in dct[fid]], dtype=np.int32)
+        offsets = np.zeros(len(fileids) + 1, dtype=np.int64)
+        np.cumsum([len(dct[fid]) for fid in fileids], out=offsets[1:])
+        return {'kind': 'tokens',
+                'fileids': self.__save_index(name + '.fileids',
+                                             {fid: k for k, fid in
+                                              enumerate(fileids)}),
+                'vocab': self.__save_strings(name + '.vocab', list(vocab_i)),
+                'ids': self.__save_array(name + '.ids', ids),
+                'offsets': self.__save_array(name + '.offsets', offsets)}
+
+
+    def __save_csr(self, name: str, m):
+        return {'kind': 'csr', 'shape': list(m.shape),
+                'data': self.__save_array(name + '.data', m.data),
+                'indices': self.__save_array(name + '.indices', m.indices),
+                'indptr': self.__save_array(name + '.indptr', m.indptr)}
+
+
+    def __load_compressed(self, entry: dict, matrix_cls):
+        return matrix_cls((self.__load_array(entry['data']),
+                           self.__load_array(entry['indices']),
+                           self.__load_array(entry['indptr'])),
+                          shape=tuple(entry['shape']), copy=False)
+
+
+    def __save(self, name: str, value):
+        if isinstance(value, DocumentBlob):
+            return {'kind': 'documents',
+                    'fileids': self.__save_index(name + '.fileids',
+                                                 dict(value.fileids)),
+                    'blob': self.__save_array(name + '.blob', value.blob),
+                    'offsets': self.__save_array(name + '.offsets',
+                                                 value.offsets)}
+        if isinstance(value, DualMatrix):
+            return {'kind': 'dual',
+                    'csr': self.__save_csr(name + '.csr', value.csr),
+                    'csc': self.__save_csr(name + '.csc', value.csc)}
+        if sps.issparse(value):
+            return self.__save_csr(name, sps.csr_matrix(value))
+        if isinstance(value, np.ndarray):
+            return {'kind': 'npy', 'name': self.__save_array(name, value)}
+        if isinstance(value, pd.Series):
+            return {'kind': 'series', 'index': value.index.tolist(),
+                    'values': value.values.tolist()}
+        if isinstance(value, (list, StringArray)) and value and all(
+                isinstance(v, str) for v in value):
+            return self.__save_strings(name, value)
+        if isinstance(value, list):
+            return {'kind': 'npy', 'name': self.__save_array(name, value)}
+        if isinstance(value, tuple):
+            return {'kind': 'tuple',
+                    'items': [self.__save('{}.{}'.format(name, k), v)
+                              for k, v in enumerate(value)]}
+        if isinstance(value, dict):
+            return {'kind': 'dict',
+                    'items': {k: self.__save('{}.{}'.format(name, k), v)
+                              for k, v in value.items()}}
+        if isinstance(value, np.generic):
+            value = value.item()
+        return {'kind': 'json', 'value': value}
+
+
+    def __load(self, entry: dict):
+        kind = entry['kind']
+        if kind == 'json':
+            return entry['value']
+        if kind == 'npy':
+            return self.__load_array(entry['name'])
+        if kind == 'series':
+            return pd.Series(entry['values'], index=entry['index'])
+        if kind == 'strings':
+            return StringArray(self.__load_array(entry['blob']),
+                               self.__load_array(entry['offsets']))
+        if kind == 'index':
+            return StringIndex(self.__load(entry['keys']),
+                               self.__load_array(entry['values']))
+        if kind == 'tokens':
+            return TokenLists(self.__load(entry['fileids']),
+                              self.__load(entry['vocab']),
+                              self.__load_array(entry['ids']),
+                              self.__load_array(entry['offsets']))
+        if kind == 'documents':
+            return DocumentBlob(self.__load(entry['fileids']),
+                                self.__load_array(entry['blob']),
+                                self.__load_array(entry['offsets']))
+        if kind == 'csr':
+            return self.__load_compressed(entry, sps.csr_matrix)
+        if kind == 'dual':
+            return DualMatrix.from_views(
+                        self.__load_compressed(entry['csr'], sps.csr_matrix),
+                        self.__load_compressed(entry['csc'], sps.csc_matrix))
+        if kind == 'tuple':
+            return tuple(self.__load(e) for e in entry['items'])
+        if kind == 'dict':
+            return {k: self.__load(e) for k, e in entry['items'].items()}
+        raise ValueError('Unknown artifact kind \'{}\''.format(kind))
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: backends of several corpora served by one app, loaded from
+#          their artifact stores on first use and evicted under a memory
+#          budget.
+
+import viz
+import profiling
+from collections import OrderedDict
+import os
+import threading
+
+
+def options_from_environ():
+    ''' Returns viz.Backend options of the served corpora.
+
+        dashboard.py and gunicorn.conf.py both read them, so the store
+        built ahead of serving has the options the app asks for. Hashed
+        n-gram features are built if WMCHACK_NGRAM_BUCKETS is set, tokens
+        are merged by stem if WMCHACK_STEM is 1 (memoizing stems in
+        WMCHACK_STEM_MEMO), and the vocabulary is pruned by WMCHACK_MIN_DF,
+        WMCHACK_MAX_DF and WMCHACK_MAX_FEATURES (see viz.py --help).
+    '''
+    environ = os.environ
+    return {'n_neighbours': 20,
+            'ngram_buckets': int(environ.get('WMCHACK_NGRAM_BUCKETS',
+                                             0)) or None,
+            'stem': environ.get('WMCHACK_STEM', '0') == '1',
+            'stem_memo_filepath': environ.get('WMCHACK_STEM_MEMO',
+                                              'stem_memo.json'),
+            'min_df': viz.df_limit(environ.get('WMCHACK_MIN_DF', '1')),
+            'max_df': viz.df_limit(environ.get('WMCHACK_MAX_DF', '1.0')),
+            'max_features': int(environ.get('WMCHACK_MAX_FEATURES',
+                                            0)) or None}
+
+
+def build_args(options: dict):
+    ''' Returns arguments of viz.py building the store with options, e.g.
+        from options_from_environ.
+    '''
+    args = ['--n-neighbours', str(options['n_neighbours']),
+            '--min-df', str(options['min_df']),
+            '--max-df', str(options['max_df'])]
+    if options['ngram_buckets']:
+        args += ['--ngram-buckets', str(options['ngram_buckets'])]
+    if options['stem']:
+        args += ['--stem', '--stem-memo', options['stem_memo_filepath']]
+    if options['max_features']:
+        args += ['--max-features', str(options['max_features'])]
+    return args
+
+
+class BackendPool:
+    ''' viz.Backend of each of several corpora, loaded on demand.
+
+        Backends are loaded (or built) with viz.Backend.load_or_build the
+        first time they are requested; with build=False, they are only
+        loaded, with viz.Backend.load. When the estimated footprint of the
+        loaded backends exceeds max_mb, the least recently used are
+        evicted; the backend just requested is always kept. Footprints
+        are measured once a backend's data is complete (backends still
+        building in the background count as 0), and count memory mapped
+        arrays at their full size, although their pages are shared
+        through the page cache and only resident while used.
+
+        Use as
+            pool = BackendPool(['uk', 'wales'], n_neighbours=20)
+            be = pool.get('wales')
+    '''
+
+    def __init__(self, corpus_ids: list, artifact_root='artifacts',
+                 max_mb=2048, build=True, **options):
+        ''' Args:
+                corpus_ids: corpora that may be served.
+                artifact_root: directory holding one store per corpus.
+                max_mb: memory budget of loaded backends.
+                build: whether missing or stale stores are built, or
+                    requesting their backends raises ValueError.
+                options: passed to viz.Backend.load_or_build.
+        '''
+        self.corpus_ids = list(corpus_ids)
+        self.artifact_root = artifact_root
+        self.max_mb = max_mb
+        self.build = build
+        self.options = options
+        self.backends = OrderedDict() # corpus_id -> Backend, oldest first
+        self.footprints = {} # corpus_id -> MB, of complete backends
+        self.n_loads = 0
+        self.n_evictions = 0
+        self.lock = threading.Lock()
+
+
+    def get(self, corpus_id: str):
+        ''' Returns Backend of corpus_id, loading it if not loaded.
+        '''
+        if corpus_id not in self.corpus_ids:
+            raise KeyError('Unknown corpus \'{}\''.format(corpus_id))
+        with self.lock:
+            if corpus_id in self.backends:
+                self.backends.move_to_end(corpus_id)
+            else:
+                load = (viz.Backend.load_or_build if self.build
+                        else viz.Backend.load)
+                self.backends[corpus_id] = load(
+                    corpus_id, os.path.join(self.artifact_root, corpus_id),
+                    cache_filepath=corpus_id + '_doc_cache.sqlite',
+                    **self.options)
+                self.n_loads += 1
+            self.__evict()
+            return self.backends[corpus_id]
+
+
+    def footprints_mb(self):
+        ''' Returns dict of corpus_id -> footprint in MB of loaded backends.
+        '''
+        with self.lock:
+            return {corpus_id: self.__footprint(corpus_id)
+                    for corpus_id in self.backends}
+
+
+    def __footprint(self, corpus_id):
+        if corpus_id not in self.footprints:
+            be = self.backends[corpus_id]
+            if not be.data.is_computed():
+                return 0.
+            self.footprints[corpus_id] = profiling.sizeof(
+                [be.data.public_attributes(), be.figures])/2**20
+        return self.footprints[corpus_id]
+
+
+    def __evict(self):
+        # drop least recently used backends until within budget
+        while (len(self.backends) > 1
+               and sum(map(self.__footprint, self.backends)) > self.max_mb):
+            corpus_id, _ = self.backends.popitem(last=False)
+            self.footprints.pop(corpus_id, None)
+            self.n_evictions += 1
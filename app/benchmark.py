@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: scaling benchmarks for the analysis pipeline on synthetic
+#          vacancy corpora with Zipfian vocabularies.
+# Usage:
+#   python benchmark.py --sizes 1000 10000 100000
+#   python benchmark.py --update-baseline    # record new baseline
+# Exits with status 1 if any stage is slower or uses more memory than
+# its baseline by more than --threshold.
+
+import analysis as an
+import viz
+import numpy as np
+from types import SimpleNamespace
+import argparse
+import json
+import os
+import string
+import sys
+import time
+import tracemalloc
+
+BASELINE_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'benchmark_baseline.json')
+
+
+def synthetic_vocabulary(vocab_size: int):
+    ''' Returns list of vocab_size distinct lowercase pseudo-words.
+
+        The most frequent ranks are stopwords, so that filtering in
+        get_corpus_words has something to remove.
+    '''
+    letters = string.ascii_lowercase
+    words = sorted(an.STOPWORDS_SET)[:50]
+    n = 0
+    while len(words) < vocab_size:
+        word, k = '', n
+        while True: # base-26 spelling of n, at least 3 letters long
+            word = letters[k % 26] + word
+            k //= 26
+            if k == 0 and len(word) >= 3:
+                break
+        words.append(word)
+        n += 1
+    return words
+
+
+def generate_corpus(corpus_id: str, n_files: int, vocab_size=50000,
+                    mean_length=300, zipf_a=1.1, seed=0):
+    ''' Writes n_files synthetic vacancy descriptions to ./corpus_id.
+
+        Token ranks are drawn from a Zipf distribution truncated at
+        vocab_size; file lengths are lognormal with mean mean_length.
+        Files are named like those written by write_corpus.
+    '''
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(synthetic_vocabulary(vocab_size))
+    p_rank = 1./np.arange(1, vocab_size + 1)**zipf_a
+    p_rank /= p_rank.sum()
+    sigma = 0.5
+    lengths = rng.lognormal(np.log(mean_length) - sigma**2/2, sigma, n_files)
+    os.mkdir(corpus_id)
+    for k, length in enumerate(lengths.astype(int) + 1):
+        tokens = vocabulary[rng.choice(vocab_size, size=length, p=p_rank)]
+        fp = os.path.join(corpus_id, '{:09d}___Synthetic vacancy.txt'.format(k))
+        with open(fp, 'w', encoding='utf-8') as f:
+            f.write('<p>' + ' '.join(tokens) + '</p>')
+
+
+def measure(fnc, *args, **kwargs):
+    ''' Returns fnc's output, wall time (s) and peak traced memory (MB).
+    '''
+    tracemalloc.start()
+    start = time.perf_counter()
+    output = fnc(*args, **kwargs)
+    wall_s = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return output, {'wall_s': wall_s, 'peak_mb': peak/2**20}
+
+
+def run_pipeline(corpus_id: str):
+    ''' Runs each benchmarked stage on corpus_id and returns their costs.
+    '''
+    results = {}
+    data = SimpleNamespace(corpus_id=corpus_id)
+    data.corpus_raw, results['read_corpus'] = measure(an.read_corpus,
+                                                      corpus_id)
+    data.corpus_words = an.get_corpus_words(data.corpus_raw)
+    data.corpus_types = an.get_corpus_types(data.corpus_words)
+    data.token_index = an.get_token_index(data.corpus_types)
+    data.fileid_index = an.get_fileid_index(data.corpus_types)
+    data.token_i = {t: j for j, t in enumerate(data.token_index)}
+    data.fileid_i = {fi: j for j, fi in enumerate(data.fileid_index)}
+    _, results['term_frequency'] = measure(an.term_frequency,
+                                           data.corpus_types,
+                                           data.corpus_words,
+                                           data.fileid_index,
+                                           data.token_index)
+    (data.s_termfreq, data.s_tfidf), results['tf_idf'] = measure(
+        an.tf_idf, data.corpus_types, data.corpus_words, data.fileid_index,
+        data.token_index)
+    data.s_tfidf_norm = an.l2_normalize(data.s_tfidf)
+    data.n_filt_tokens_by_file = an.n_tokens_by_file(data.corpus_words,
+                                                     data.fileid_index)
+
+    # query a mid-frequency token and the first file
+    keyword = data.token_index[len(data.token_index)//2]
+    _, results['similar_words'] = measure(an.similar_words, keyword,
+                                          data.token_i, data.token_index,
+                                          data.s_tfidf)
+    _, results['jacard_index'] = measure(an.jacard_index, data.s_termfreq,
+                                         data.fileid_index[0], data.fileid_i,
+                                         data.fileid_index)
+    # in the order Backend.Data produces them, the scatter plotting the
+    # embedding computed just before
+    (data.svd_components, data.svd_coords), results['svd_embedding'] = \
+        measure(an.svd_embedding, data.s_tfidf_norm)
+    graph = viz.Backend.Viz.Graph()
+    _, results['scatter_pc_tfidf'] = measure(graph.scatter_pc_tfidf, data)
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float):
+    ''' Returns list of messages for costs exceeding baseline*(1 + threshold).
+    '''
+    regressions = []
+    for size, stages in results.items():
+        for stage, costs in stages.items():
+            for cost, value in costs.items():
+                try:
+                    reference = baseline[size][stage][cost]
+                except KeyError:
+                    continue # nothing to compare against
+                if value > reference*(1 + threshold):
+                    regressions.append(
+                        '{} docs, {}: {} {:.3f} vs baseline {:.3f}'.format(
+                            size, stage, cost, value, reference))
+    return regressions
+
+
+def format_table(results: dict):
+    ''' Returns results as a plaintext table.
+    '''
+    lines = ['{:>8}  {:<18}{:>10}{:>10}'.format('docs', 'stage', 'wall_s',
+                                                 'peak_mb')]
+    for size, stages in results.items():
+        for stage, costs in stages.items():
+            lines.append('{:>8}  {:<18}{:>10.3f}{:>10.1f}'.format(
+                size, stage, costs['wall_s'], costs['peak_mb']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the analysis pipeline on synthetic corpora.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--workdir', default='benchmark_corpora',
+                        help='directory in which corpora are generated')
+    parser.add_argument('--baseline', default=BASELINE_FILEPATH)
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed fractional increase over baseline')
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    baseline_filepath = os.path.abspath(args.baseline)
+    os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir) # read_corpus reads from ./corpus_id
+
+    results = {}
+    for size in args.sizes:
+        corpus_id = 'synthetic_{}'.format(size)
+        if not os.path.isdir(corpus_id):
+            generate_corpus(corpus_id, size)
+        results[str(size)] = run_pipeline(corpus_id)
+    print(format_table(results))
+
+    if args.update_baseline or not os.path.exists(baseline_filepath):
+        with open(baseline_filepath, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('Wrote baseline to {}'.format(baseline_filepath))
+        sys.exit(0)
+
+    with open(baseline_filepath, 'r') as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline, args.threshold)
+    for msg in regressions:
+        print('REGRESSION ' + msg)
+    sys.exit(1 if regressions else 0)
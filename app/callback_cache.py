@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: on-disk cache of Dash callback results shared by every server
+#          worker process, used by dashboard.py.
+
+import functools
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+import time
+
+
+class CallbackCache:
+    ''' SQLite-backed cache of callback results keyed by their arguments.
+
+        Keys hash the function name and arguments together with version,
+        e.g. the backend's artifacts.version, so results computed from a
+        previous corpus or build always miss. Entries older than ttl_s
+        are treated as missing, and when the cache exceeds max_mb the
+        least recently used entries are evicted. Worker processes opening
+        the same filepath share entries and hit/miss counts.
+
+        Use as
+            cache = CallbackCache('callback_cache.sqlite', be.version)
+
+            @app.callback(...)
+            @cache.memoize
+            def update(value): ...
+    '''
+
+    def __init__(self, filepath: str, version: str, max_mb=64, ttl_s=3600):
+        self.filepath = filepath
+        self.version = version
+        self.max_bytes = int(max_mb*2**20)
+        self.ttl_s = ttl_s
+        self.local = threading.local() # sqlite connections are per thread
+        with self.__conn() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY, value BLOB, nbytes INTEGER,
+                    created REAL, last_used REAL);
+                CREATE INDEX IF NOT EXISTS results_last_used
+                    ON results (last_used);
+                CREATE TABLE IF NOT EXISTS counts (
+                    name TEXT PRIMARY KEY, n INTEGER);
+                CREATE TABLE IF NOT EXISTS claims (
+                    key TEXT PRIMARY KEY, started REAL);
+                INSERT OR IGNORE INTO counts VALUES ('hits', 0), ('misses', 0);
+            ''')
+
+
+    def __conn(self):
+        if not hasattr(self.local, 'conn'):
+            self.local.conn = sqlite3.connect(self.filepath, timeout=30)
+            self.local.conn.execute('PRAGMA journal_mode=WAL')
+        return self.local.conn
+
+
+    def key(self, name: str, args: tuple):
+        ''' Returns hash identifying the result of name(*args).
+        '''
+        h = hashlib.sha1(self.version.encode('utf-8'))
+        h.update(json.dumps([name, args], sort_keys=True,
+                            default=str).encode('utf-8'))
+        return h.hexdigest()
+
+
+    def get(self, key: str):
+        ''' Returns (True, value) cached under key, or (False, None),
+            counting a hit or a miss.
+        '''
+        found, value = self.peek(key)
+        self.count(found)
+        return found, value
+
+
+    def peek(self, key: str):
+        ''' Returns (True, value) cached under key, or (False, None),
+            without counting a hit or a miss, e.g. when polling for a
+            result whose lookup was already counted.
+        '''
+        now = time.time()
+        with self.__conn() as conn:
+            row = conn.execute('SELECT value FROM results WHERE key = ? '
+                               'AND created > ?',
+                               (key, now - self.ttl_s)).fetchone()
+            if row is None:
+                return False, None
+            conn.execute('UPDATE results SET last_used = ? WHERE key = ?',
+                         (now, key))
+        return True, pickle.loads(row[0])
+
+
+    def count(self, hit: bool):
+        ''' Counts a hit or a miss, e.g. of a lookup made with peek.
+        '''
+        with self.__conn() as conn:
+            conn.execute('UPDATE counts SET n = n + 1 WHERE name = ?',
+                         ('hits' if hit else 'misses',))
+
+
+    def put(self, key: str, value, ttl_s=None):
+        ''' Caches value, then evicts expired and least recently used
+            entries down to max_mb.
+
+            value expires after ttl_s seconds if given, at most the
+            cache's ttl_s, e.g. for errors that may not recur.
+        '''
+        blob = pickle.dumps(value)
+        now = time.time()
+        # entries expire ttl_s after they were created, so a shorter ttl_s
+        # is recorded as an earlier creation
+        created = now if ttl_s is None else now - max(self.ttl_s - ttl_s, 0)
+        with self.__conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                         (key, blob, len(blob), created, now))
+            conn.execute('DELETE FROM results WHERE created <= ?',
+                         (now - self.ttl_s,))
+            total = conn.execute('SELECT SUM(nbytes) FROM results').fetchone()[0]
+            if total > self.max_bytes:
+                evict = []
+                for evict_key, nbytes in conn.execute(
+                        'SELECT key, nbytes FROM results ORDER BY last_used'):
+                    if total <= self.max_bytes:
+                        break
+                    evict.append((evict_key,))
+                    total -= nbytes
+                conn.executemany('DELETE FROM results WHERE key = ?', evict)
+
+
+    def claim(self, key: str, timeout_s=600):
+        ''' Marks key's result as being computed, e.g. by jobs.JobRunner.
+
+            Returns False if another thread or worker already claimed key
+            less than timeout_s ago, so only one computes it.
+        '''
+        now = time.time()
+        with self.__conn() as conn:
+            conn.execute('DELETE FROM claims WHERE key = ? AND started <= ?',
+                         (key, now - timeout_s))
+            return conn.execute('INSERT OR IGNORE INTO claims VALUES (?, ?)',
+                                (key, now)).rowcount == 1
+
+
+    def claimed_at(self, key: str):
+        ''' Returns time key was claimed, or None if it is not claimed.
+        '''
+        with self.__conn() as conn:
+            row = conn.execute('SELECT started FROM claims WHERE key = ?',
+                               (key,)).fetchone()
+        return None if row is None else row[0]
+
+
+    def release(self, key: str):
+        with self.__conn() as conn:
+            conn.execute('DELETE FROM claims WHERE key = ?', (key,))
+
+
+    def memoize(self, fnc):
+        ''' Decorator caching fnc's results by its arguments.
+        '''
+        @functools.wraps(fnc)
+        def wrapper(*args):
+            key = self.key(fnc.__name__, args)
+            found, value = self.get(key)
+            if not found:
+                value = fnc(*args)
+                self.put(key, value)
+            return value
+        return wrapper
+
+
+    def stats(self):
+        ''' Returns dict of hits, misses and hit_rate across all workers,
+            and the number and size of entries.
+        '''
+        with self.__conn() as conn:
+            counts = dict(conn.execute('SELECT name, n FROM counts'))
+            n_entries, nbytes = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM results'
+            ).fetchone()
+        n_lookups = counts['hits'] + counts['misses']
+        return {'hits': counts['hits'], 'misses': counts['misses'],
+                'hit_rate': counts['hits']/n_lookups if n_lookups else None,
+                'n_entries': n_entries, 'mb': nbytes/2**20}
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: classifies vacancies into professional groups using a linear
+#          model trained on tf-idf features from viz.Backend.Data.
+# Usage:
+#   python classify.py corpus_id seeds.csv predictions.feather
+
+import analysis as an
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import normalize
+from tqdm import tqdm
+import argparse
+import time
+
+
+def load_seed_labels(csv_filepath: str, fileid_index: list):
+    ''' Reads labelled seed vacancies from a CSV file.
+
+        The CSV needs a 'label' column and either a 'fileid' column
+        (corpus file names) or an 'id' column (9-digit vacancy ids, as
+        in load_descriptions_as_df).
+
+        Args:
+            csv_filepath: path of seed CSV.
+            fileid_index: fileids of the corpus the seeds belong to.
+
+        Returns:
+            pd.Series: labels indexed by fileid.
+    '''
+    df = pd.read_csv(csv_filepath, dtype=str)
+    if 'fileid' not in df.columns:
+        fileid_by_id = {fid.split('___')[0]: fid for fid in fileid_index}
+        df['fileid'] = df['id'].map(fileid_by_id)
+    missing = df['fileid'].isna() | ~df['fileid'].isin(fileid_index)
+    if missing.any():
+        raise KeyError('{} seed vacancies are not in the corpus'.format(
+                            missing.sum()))
+    return df.set_index('fileid')['label']
+
+
+class RoleClassifier:
+    ''' Linear classifier over L2-normalized tf-idf vectors.
+
+        If data was built with ngram_buckets, each vector is extended
+        with the file's L2-normalized hashed n-gram tf-idf vector, and
+        the two are normalized together so that each weighs the same.
+
+        Keeps the corpus vocabulary and idf weights so that vacancies
+        arriving after the build (e.g. from scraper.py) can be scored
+        with predict without rebuilding the Backend.
+    '''
+
+    def __init__(self, data, C=10., ngram_range=(2, 3)):
+        ''' Args:
+                data: viz.Backend.Data of the corpus.
+                C: inverse regularization strength of the model.
+                ngram_range: n-gram lengths data's n-grams were hashed
+                             with (viz.Backend.Data's default).
+        '''
+        self.token_i = data.token_i
+        self.n_tokens = data.s_tfidf.shape[1] # token_i may alias stems
+        self.m_invdocfreq = an.inv_document_frequency(data.s_termfreq)
+        self.n_buckets = None # no n-gram features
+        if data.s_ngram_tfidf is not None:
+            self.n_buckets = data.s_ngram_tfidf.shape[1]
+            self.ngram_range = ngram_range
+            m_idf = an.inv_document_frequency(data.s_ngram_termfreq)
+            # buckets no corpus file hashed into carry no weight
+            self.m_ngram_invdocfreq = np.where(np.isfinite(m_idf), m_idf, 0.)
+        self.model = LogisticRegression(C=C, max_iter=1000)
+        self.docs_per_second = None # throughput of last scoring run
+
+
+    def features(self, data):
+        ''' Returns CSR matrix of the feature vector of every corpus file.
+        '''
+        if self.n_buckets is None:
+            return data.s_tfidf_norm
+        return self.__combine(data.s_tfidf_norm,
+                              an.l2_normalize(data.s_ngram_tfidf))
+
+
+    def fit(self, data, ser_labels: pd.Series):
+        ''' Trains the model on the seed vacancies in ser_labels.
+        '''
+        rows = [data.fileid_i[fid] for fid in ser_labels.index]
+        self.model.fit(self.features(data)[rows], ser_labels.values)
+        return self
+
+
+    def predict_corpus(self, data, chunk_size=10000):
+        ''' Scores every file of the corpus in chunks of chunk_size rows.
+
+            Returns:
+                pd.DataFrame: predicted label and its probability by fileid.
+        '''
+        X = self.features(data)
+        chunks = range(0, X.shape[0], chunk_size)
+        df = pd.concat([self.__score(X[start:start + chunk_size])
+                        for start in tqdm(chunks)])
+        df.index = data.fileid_index
+        return df
+
+
+    def predict(self, descriptions, batch_size=1000):
+        ''' Scores raw vacancy descriptions as they arrive.
+
+            Args:
+                descriptions: iterable of description strings (HTML allowed).
+                batch_size: descriptions vectorized per model call.
+
+            Yields:
+                pd.DataFrame: predicted label and probability for each batch.
+        '''
+        batch = []
+        for description in descriptions:
+            batch.append(description)
+            if len(batch) == batch_size:
+                yield self.__score(self.vectorize(batch))
+                batch = []
+        if batch:
+            yield self.__score(self.vectorize(batch))
+
+
+    def vectorize(self, descriptions: list):
+        ''' Returns CSR matrix of feature vectors of raw descriptions.
+
+            Tokens outside the training vocabulary are dropped.
+        '''
+        token_rows, ngram_rows = [], []
+        for description in descriptions:
+            tokens = an.remove_stopwords_and_punctuation(
+                        an.tokenize(an.clean(description)))
+            # int64 even when empty, so files without known tokens are zero
+            token_rows.append(np.fromiter((self.token_i[t] for t in tokens
+                                           if t in self.token_i),
+                                          dtype=np.int64))
+            if self.n_buckets is not None:
+                ngram_rows.append(np.array(an.hashed_ngrams(
+                                                tokens, self.n_buckets,
+                                                self.ngram_range),
+                                           dtype=np.int64))
+        X = normalize(self.__tfidf_rows(token_rows, self.m_invdocfreq,
+                                        self.n_tokens))
+        if self.n_buckets is None:
+            return X
+        return self.__combine(X, normalize(self.__tfidf_rows(
+                                                ngram_rows,
+                                                self.m_ngram_invdocfreq,
+                                                self.n_buckets)))
+
+
+    @staticmethod
+    def __tfidf_rows(rows, m_invdocfreq, n_cols):
+        # CSR matrix of tf-idf from the column of every term of each row
+        indptr, indices, data = [0], [], []
+        for cols in rows:
+            file_cols, file_counts = np.unique(cols, return_counts=True)
+            indices.append(file_cols)
+            data.append(file_counts*m_invdocfreq[file_cols])
+            indptr.append(indptr[-1] + len(file_cols))
+        return sps.csr_matrix((np.concatenate(data), np.concatenate(indices),
+                               indptr), shape=(len(rows), n_cols))
+
+
+    @staticmethod
+    def __combine(X_tokens, X_ngrams):
+        return normalize(sps.hstack([X_tokens, X_ngrams], format='csr'))
+
+
+    def __score(self, X):
+        start = time.perf_counter()
+        m_proba = self.model.predict_proba(X)
+        best = m_proba.argmax(axis=1)
+        self.docs_per_second = X.shape[0]/(time.perf_counter() - start)
+        return pd.DataFrame({
+            'label': self.model.classes_[best],
+            'probability': m_proba[np.arange(len(best)), best]
+        })
+
+
+def write_predictions(df_predictions: pd.DataFrame, feather_filepath: str):
+    ''' Writes per-vacancy predictions output by predict_corpus to Feather.
+    '''
+    df = df_predictions.rename_axis('fileid').reset_index()
+    df['id'] = df['fileid'].str.split('___').str[0]
+    df.to_feather(feather_filepath)
+
+
+if __name__ == '__main__':
+    import viz
+
+    parser = argparse.ArgumentParser(
+        description='Classifies corpus vacancies from labelled seeds.')
+    parser.add_argument('corpus_id')
+    parser.add_argument('seed_csv')
+    parser.add_argument('predictions_feather')
+    parser.add_argument('--ngram-buckets', type=int,
+                        help='also use n-grams hashed into this many buckets')
+    args = parser.parse_args()
+
+    data = viz.Backend.Data(args.corpus_id, ngram_buckets=args.ngram_buckets)
+    if data.ngram_report is not None:
+        print(an.format_ngram_report(data.ngram_report))
+    ser_labels = load_seed_labels(args.seed_csv, data.fileid_index)
+    clf = RoleClassifier(data).fit(data, ser_labels)
+    start = time.perf_counter()
+    df_predictions = clf.predict_corpus(data)
+    write_predictions(df_predictions, args.predictions_feather)
+    print('Scored {:,} vacancies at {:,.0f} docs/second'.format(
+            len(df_predictions),
+            len(df_predictions)/(time.perf_counter() - start)))
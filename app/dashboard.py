@@ -0,0 +1,617 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: the dashboard's layout, callbacks and the backends, caches, job
+#          runner and metrics behind them; served through app.py.
+
+import dash
+import dash_core_components as dcc
+import dash_html_components as dhtml
+from dash.dependencies import Input, Output, State
+import dash_table as dtable
+import analysis as an
+import viz
+import callback_cache
+import backends
+import artifacts
+import jobs
+import metrics
+import profiling
+import plotly.io as pio
+import os
+import flask
+
+pio.templates.default = 'seaborn'
+
+# intialize app obj
+external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
+app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+server = app.server # WSGI entry point, via app.py, e.g. gunicorn app:server
+
+# Corpora served, selected in the header; each backend and its prerendered
+# figures are loaded from its artifact store when first selected, rebuilding
+# the store only if the corpus changed (or ahead of time with
+# python viz.py <corpus_id>). A rebuild runs in the background, so the
+# corpus specification is served while the tf-idf structures behind the
+# corpus statistics are built. Least recently used backends are evicted
+# when their footprint exceeds WMCHACK_MAX_MB.
+corpus_ids = os.environ.get('WMCHACK_CORPORA', 'uk').split(',')
+pool = backends.BackendPool(corpus_ids,
+                            max_mb=float(os.environ.get('WMCHACK_MAX_MB',
+                                                        2048)),
+                            **backends.options_from_environ())
+
+# callback results shared by all server workers; callbacks pass their
+# backend's version, so a new build is never served stale results
+cache = callback_cache.CallbackCache('callback_cache.sqlite',
+                                     artifacts.PIPELINE_VERSION)
+
+# Jaccard scatters of new file pairs are computed by background jobs in a
+# process pool and stored in the callback cache; the callback polls them
+# while serving the last result
+runner = jobs.start_runner(cache, corpus_ids,
+                           n_jobs=int(os.environ.get('WMCHACK_JOBS', 2)),
+                           max_mb=pool.max_mb,
+                           **backends.options_from_environ())
+
+# how often callbacks waiting for a job poll it, in milliseconds
+job_poll_ms = 500
+
+# documents are truncated to this many bytes for display
+max_display_bytes = 20000
+
+# tab style
+tab_style = {
+    'borderBottom': '1px solid #d6d6d6',
+    'padding': '6px',
+    'fontWeight': 'bold'
+}
+
+tab_selected_style = {
+    'borderTop': '1px solid #d6d6d6',
+    'borderBottom': '1px solid #d6d6d6',
+    'backgroundColor': '#CC1F1F',
+    'color': 'white',
+    'padding': '6px'
+}
+
+main_tab_selected_style = {
+    'borderTop': '1px solid #CC1F1F',
+}
+
+# include visualizations
+e_header = [dcc.Markdown('''
+_2020 Decision Analysis Services Ltd._
+
+# **Text Mining Web Application**
+'''),
+    dhtml.Div(['Corpus: ',
+               dcc.Dropdown(id='dropdown-corpus',
+                            options=[{'label': c, 'value': c}
+                                     for c in corpus_ids],
+                            value=corpus_ids[0], clearable=False,
+                            style={'width':'200px', 'display':'inline-block',
+                                   'vertical-align':'middle'})])
+]
+
+corpus_descr = 'Vacancy descriptions featured on NHS Jobs on 7th Nov 2020'
+source_url = 'https://www.jobs.nhs.uk/'
+offset = 20
+
+def e_corpus_spec(be):
+    return [
+    dcc.Markdown('''
+    ## **Corpus Specification**
+
+    ##### Data source:  ''' + '&nbsp;'*(offset-12) 
+    + '[' + corpus_descr + ']'
+    + '(' + source_url + ')'
+    + '''  
+
+    ##### Files: ''' + '&nbsp;'*offset
+    + '{:,}'.format(be.data.n_files)
+    + '''  
+
+    ##### Words: ''' + '&nbsp;'*(offset-2) 
+    + '{:,}'.format(be.data.n_words)
+    + '''  
+
+    ##### Unique words: ''' + '&nbsp;'*(offset - 15)
+    + be.viz.md.n_unique_tokens_in_raw(be.data),
+    id='sec-corpus-specification'
+    ),
+
+    dhtml.Br(),
+    
+    dhtml.Div([
+        dcc.Markdown('''
+        ##### Distribution of file lengths  ''' 
+        ),
+        dcc.Graph(
+            id='graph-filelengthcdf',
+            figure=be.figure('line_cdf_n_tokens_in_corpus_raw'),
+            style={
+                'width':'450px',
+                'height':'350px',
+                'display':'block',
+                'margin-left':'auto',
+                'margin-right':'auto'
+            }
+        )],
+    style={'width':'50%', 'display':'inline-block', 'vertical-align':'top'}
+    ),
+
+    dhtml.Div([
+        dcc.Markdown('''
+        ##### Distribution of token lengths  ''' 
+        ),
+        dcc.Graph(
+            id='graph-tokenlengthpmf',
+            figure=be.figure('bar_pmf_token_lengths'),
+            style={
+                'width':'450px',
+                'height':'350px',
+                'display':'block',
+                'margin-left':'auto',
+                'margin-right':'auto'
+            }
+        )],
+    style={'width':'50%', 'display':'inline-block', 'vertical-align':'top'}
+    ),
+
+    dhtml.Br(),
+    dhtml.Br(),
+
+    dcc.Markdown('''
+    ##### 100 most common tokens  ''' 
+    ),
+    dcc.Graph(
+        id='graph-toptokens',
+        figure=be.figure('bar_cdf_most_common_tokens'),
+        style={
+            'width':'700px',
+            'height':'400px',
+            'display':'block',
+            'margin-left':'auto',
+            'margin-right':'auto'
+        }
+    ),
+
+    ]
+
+
+def e_corpus_preprocessing(be):
+    return [
+    dcc.Markdown('''
+    ## **Preprocessing summary**  
+    '''
+    ),
+    
+    dcc.Markdown('##### Sample text from source'),
+    dhtml.Div([
+        dcc.Markdown('''  
+        > ```'''
+        + be.viz.md.source_text(be.data, be.data.example_fileid,
+                max_bytes=max_display_bytes)
+        + '''```  '''
+        )
+    ], style={'height':'300px', 'width':'100%',
+              'overflow-y':'scroll',
+              'word-wrap':'break-word'}
+    ),
+    dhtml.Br(),
+    dcc.Markdown('''
+        ##### Sample raw tokens from file ''' 
+        + '`{}`'.format(be.data.example_fileid)
+    ),
+    dhtml.Div([
+        dcc.Markdown('''  
+        > ```'''
+        + be.viz.md.raw_tokens_in_file(be.data, be.data.example_fileid,
+                max_bytes=max_display_bytes)
+        + '''```'''
+        )
+    ], style={'height':'300px', 'overflow':'auto'}
+    ),
+    dhtml.Br(),
+    dcc.Markdown('''
+        ##### Sample filtered tokens from file ''' 
+        + '`{}`'.format(be.data.example_fileid)
+    ),
+    dhtml.Div([
+        dcc.Markdown('''  
+        > ```'''
+        + be.viz.md.filtered_tokens_in_file(be.data, be.data.example_fileid,
+                max_bytes=max_display_bytes)
+        + '''```  '''
+        )
+    ], style={'height':'300px', 'overflow':'auto'}
+    )
+    ]
+
+
+e_div_wordsearch = [
+    dhtml.Br(), 
+    dcc.Markdown('''
+    ##### What other words appear in files that contain `keyword`?
+    
+    Enter a keyword to find words that commonly occur in the same file,
+     but that are not common to all files in the corpus.
+    '''
+    ),
+    dhtml.Div(['Keyword: ',
+              dcc.Input(id='input-wordsearch', value='analyst', type='text',
+                        list='datalist-wordsearch'),
+              dhtml.Datalist(id='datalist-wordsearch')],
+              style={'width':'40%', 'display':'inline-block'}),
+    dhtml.Div(id='div-wordsearch-confirm',
+              style={'width':'60%', 'display':'inline-block'}),
+
+    dhtml.Br(),
+    dhtml.Br(),
+
+    dhtml.Div(id='div-wordsearch-table')
+]
+
+
+e_graph_pca = [
+    dhtml.Br(), 
+    dcc.Markdown('''
+        ##### Are there clusters of files containing similar words?  
+
+        '''),
+    dhtml.Div([
+        dcc.Graph(
+            id='graph-pca',
+            style={
+                'width':'450px',
+                'height':'350px',
+                'display':'block-inline',
+                'margin-left':'auto',
+                'margin-right':'auto',
+                'vertical-align':'top'
+            }
+        )],
+    style={'width':'50%', 'display':'inline-block', 'vertical-align':'top'}
+    ),
+    dhtml.Div([
+        dcc.Markdown(id='markdown-pca')
+        ],
+    style={'width':'50%', 'display':'inline-block', 'vertical-align':'top'}
+    ),
+
+    dhtml.Br(),
+    dcc.Markdown('''
+        ##### More like this  
+        '''),
+    dhtml.Div(id='div-pca-similarfiles')
+]
+
+
+e_graph_jacardindex = [
+    dhtml.Br(),
+    dcc.Markdown('''
+        ##### Which files share words with `file1` and `file2`?  
+
+        '''),
+    dhtml.Div(['File 1: ',
+               dcc.Input(id='input-jacard-file1', type='text', debounce=True,
+                         placeholder=viz.JACARD_PAIR[0]),
+               ' File 2: ',
+               dcc.Input(id='input-jacard-file2', type='text', debounce=True,
+                         placeholder=viz.JACARD_PAIR[1])]),
+    dhtml.Div(id='div-jacard-status'),
+    dcc.Interval(id='interval-jacard', interval=job_poll_ms, disabled=True),
+    dhtml.Div([
+        dcc.Markdown(id='markdown-jacardindex')
+        ],
+    style={'height':'350px', 'width':'50%', 'overflow':'auto',
+           'display':'inline-block', 'vertical-align':'top'}
+    ),
+    dhtml.Div([
+        dcc.Graph(
+            id='graph-jacardindex',
+            style={
+                'width':'350px',
+                'height':'350px',
+                'display':'block-inline',
+                'margin-left':'auto',
+                'margin-right':'auto'
+            })
+        ],
+    style={'width':'50%', 'display':'inline-block', 'vertical-align':'top'}
+    )
+]
+
+e_corpus_statistics = [
+    dcc.Markdown('''
+    ## **Corpus Statistics**  
+    ''',
+    id='sec-corpus-statistics'),
+    dhtml.Div([
+        dcc.Tabs([
+            dcc.Tab(label='Jacard index scatter plot',
+                    children=e_graph_jacardindex,
+                    style=tab_style,
+                    selected_style=tab_selected_style),
+            dcc.Tab(label='Word similarity search',
+                    children=e_div_wordsearch,
+                    style=tab_style,
+                    selected_style=tab_selected_style),
+            dcc.Tab(label='Document cluster analysis',
+                    children=e_graph_pca,
+                    style=tab_style,
+                    selected_style=tab_selected_style)
+        ],
+        style={'width':'95%'})],
+    style={'height':'700px'})
+]
+
+app.layout = dhtml.Div([
+    *e_header,
+    dhtml.Hr(),
+    dcc.Tabs([
+        dcc.Tab(label='Corpus Specification', 
+                children=dhtml.Div(id='div-corpus-spec'),
+                selected_style=main_tab_selected_style
+        ),
+        dcc.Tab(label='Preprocessing',
+                children=dhtml.Div(id='div-corpus-preprocessing'),
+                selected_style=main_tab_selected_style
+        ),
+        dcc.Tab(label='Corpus Statistics',
+                children=e_corpus_statistics,
+                selected_style=main_tab_selected_style
+        )
+    ])
+], 
+style={'width': '60%', 'margin':'auto'}
+)
+
+
+# define callbacks
+
+# sections showing the selected corpus
+@app.callback(
+    [Output('div-corpus-spec', 'children'),
+     Output('div-corpus-preprocessing', 'children')],
+    [Input('dropdown-corpus', 'value')])
+def render_corpus_sections(corpus_id):
+    be = pool.get(corpus_id)
+    return e_corpus_spec(be), e_corpus_preprocessing(be)
+
+
+def clicked_fileid(clickData, be):
+    # fileid of a clicked marker, or None if nothing in this corpus is
+    try:
+        fileid = clickData['points'][0]['hovertext']
+    except TypeError:
+        return None
+    return fileid if fileid in be.data.fileid_i else None
+
+
+# figures built from tf-idf, rendered once they are ready rather than when
+# the layout is built
+@app.callback(
+    Output('graph-pca', 'figure'),
+    [Input('graph-pca', 'relayoutData'),
+     Input('dropdown-corpus', 'value')])
+def render_graph_pca(relayoutData, corpus_id):
+    # redraw points within the zoomed region in more detail
+    be = pool.get(corpus_id)
+    relayoutData = relayoutData or {}
+    x_range, y_range = [[relayoutData[axis + '.range[0]'],
+                         relayoutData[axis + '.range[1]']]
+                        if axis + '.range[0]' in relayoutData else None
+                        for axis in ['xaxis', 'yaxis']]
+    if (x_range is None and y_range is None) or any(
+            'dropdown-corpus' in t['prop_id']
+            for t in dash.callback_context.triggered):
+        return be.figure('scatter_pc_tfidf')
+    return be.viz.graph.scatter_pc_tfidf(be.data, x_range=x_range,
+                                         y_range=y_range)
+
+
+def job_progress(job, description):
+    # status line of a job that is not done
+    if job.status == 'failed':
+        return 'Failed to compute {}: {}'.format(description, job.value)
+    return 'Computing {}{}{} ...'.format(
+        description,
+        '' if job.elapsed_s is None else ' ({:.0f} s)'.format(job.elapsed_s),
+        '' if job.value is None else ', showing previous results')
+
+
+# the default file pair is prerendered, and files not entered default to
+# it; other pairs are computed by a job
+@app.callback(
+    [Output('input-jacard-file1', 'placeholder'),
+     Output('input-jacard-file2', 'placeholder')],
+    [Input('dropdown-corpus', 'value')])
+def update_jacard_placeholders(corpus_id):
+    return list(viz.default_jacard_pair(pool.get(corpus_id).data))
+
+
+@app.callback(
+    [Output('graph-jacardindex', 'figure'),
+     Output('div-jacard-status', 'children'),
+     Output('interval-jacard', 'disabled')],
+    [Input('input-jacard-file1', 'value'),
+     Input('input-jacard-file2', 'value'),
+     Input('dropdown-corpus', 'value'),
+     Input('interval-jacard', 'n_intervals')])
+def render_graph_jacardindex(fileid_1, fileid_2, corpus_id, n_intervals):
+    be = pool.get(corpus_id)
+    default_1, default_2 = viz.default_jacard_pair(be.data)
+    fileid_1, fileid_2 = fileid_1 or default_1, fileid_2 or default_2
+    if (fileid_1, fileid_2) == (default_1, default_2):
+        return be.figure('scatter_jacard'), '', True
+    missing = [f for f in [fileid_1, fileid_2] if f not in be.data.fileid_i]
+    if missing:
+        return (dash.no_update,
+                'The file \'{}\' is not in the corpus.'.format(missing[0]),
+                True)
+    poll = any('interval-jacard' in t['prop_id']
+               for t in dash.callback_context.triggered)
+    job = runner.result('jacard_figure', be.version,
+                        (corpus_id, fileid_1, fileid_2), jobs.jacard_figure,
+                        poll=poll)
+    if job.status == 'done':
+        return job.value, '', True
+    return (dash.no_update if job.value is None else job.value,
+            job_progress(job, 'the Jaccard indices of this pair'),
+            job.status == 'failed')
+
+
+# keyword search - suggest tokens completing what has been typed so far
+@app.callback(
+    Output('datalist-wordsearch', 'children'),
+    [Input('input-wordsearch', 'value')],
+    [State('dropdown-corpus', 'value')])
+def update_wordsearch_suggestions(prefix, corpus_id):
+    be = pool.get(corpus_id)
+    return be.viz.table.token_suggestions(be.data, prefix)
+
+
+# keyword search - search once the keyword is committed (enter or leaving
+# the box) and is a token in the corpus
+@app.callback(
+    [Output(component_id='div-wordsearch-confirm', component_property='children'),
+     Output(component_id='div-wordsearch-table', component_property='children')],
+    [Input(component_id='input-wordsearch', component_property='n_submit'),
+     Input(component_id='input-wordsearch', component_property='n_blur'),
+     Input(component_id='dropdown-corpus', component_property='value')],
+    [State(component_id='input-wordsearch', component_property='value')]
+)
+def update_table_of_similar_words(n_submit, n_blur, corpus_id, keyword):
+    be = pool.get(corpus_id)
+    if not keyword or keyword not in be.data.token_i:
+        return (('The token \'{}\' does not appear in the corpus.').format(
+                    keyword), dash.no_update)
+    return similar_words(be.version, corpus_id, keyword)
+
+
+@cache.memoize
+def similar_words(version, corpus_id, keyword):
+    be = pool.get(corpus_id)
+    output_keyword_confirm = 'Showing results for token \'{}\''.format(keyword)
+    output_keyword_table = be.viz.table.similar_words(be.data, keyword)
+    return (output_keyword_confirm, output_keyword_table)
+
+
+# PCA explorer - display file info on click
+@app.callback(
+    Output('markdown-pca', 'children'),
+    [Input('graph-pca', 'clickData'),
+     Input('dropdown-corpus', 'value')])
+def update_file_displayed_pca(clickData, corpus_id):
+    be = pool.get(corpus_id)
+    fileid = clicked_fileid(clickData, be)
+    if fileid is None:
+        return '> `Click a marker to display file statistics`'
+    return file_statistics(be.version, corpus_id, fileid)
+
+
+@cache.memoize
+def file_statistics(version, corpus_id, fileid):
+    be = pool.get(corpus_id)
+    return (
+        'File id  \n`\'{}\'`  \n\n'.format(fileid) 
+        + 'Tokens in file  \n `{}`  \n\n'.format(
+                be.viz.md.n_tokens_in_file(be.data, fileid))
+        + 'Distinguishing tokens  \n'
+        + '`' + be.viz.md.top_tfidf(be.data, fileid) + '`'
+        )
+
+
+# PCA explorer - list most similar files on click
+@app.callback(
+    Output('div-pca-similarfiles', 'children'),
+    [Input('graph-pca', 'clickData'),
+     Input('dropdown-corpus', 'value')])
+def update_similar_files_pca(clickData, corpus_id):
+    be = pool.get(corpus_id)
+    fileid = clicked_fileid(clickData, be)
+    if fileid is None:
+        return '> `Click a marker to list the most similar files`'
+    return similar_files(be.version, corpus_id, fileid)
+
+
+@cache.memoize
+def similar_files(version, corpus_id, fileid):
+    be = pool.get(corpus_id)
+    return be.viz.table.similar_files(be.data, fileid)
+
+
+# Document similarity explorer
+@app.callback(
+    Output('markdown-jacardindex', 'children'),
+    [Input('graph-jacardindex', 'clickData'),
+     Input('dropdown-corpus', 'value')])
+def update_file_displayed_jacardindex(clickData, corpus_id):
+    be = pool.get(corpus_id)
+    fileid = clicked_fileid(clickData, be)
+    if fileid is None:
+        return '> `Click a marker to display file contents`'
+    return ('Tokens in file `\'' + fileid + '\'`  \n' 
+            + '> `' + be.viz.md.filtered_tokens_in_file(be.data,
+                            fileid, max_bytes=max_display_bytes) + '`')
+
+# hit rate of the callback cache across workers
+@app.server.route('/callback-cache-stats')
+def callback_cache_stats():
+    return flask.jsonify(cache.stats())
+
+
+# latency and errors of every callback above, callback cache hit rates and
+# the memory of each worker, aggregated across workers for Prometheus
+monitor = metrics.Metrics('metrics.sqlite')
+monitor.instrument(app)
+monitor.describe('wmchack_callback_cache_lookups_total', 'counter',
+                 'Callback cache lookups by result, across workers.')
+monitor.describe('wmchack_callback_cache_hit_ratio', 'gauge',
+                 'Fraction of callback cache lookups that hit.')
+monitor.describe('wmchack_callback_cache_bytes', 'gauge',
+                 'Size of cached callback results.')
+monitor.describe('process_resident_memory_bytes', 'gauge',
+                 'Resident set size of each worker process.')
+monitor.describe('wmchack_backend_bytes', 'gauge',
+                 'Estimated footprint of each worker\'s loaded backends, '
+                 'counting memory mapped arrays in full.')
+monitor.describe('wmchack_backend_loads_total', 'counter',
+                 'Backends loaded by each worker.')
+monitor.describe('wmchack_backend_evictions_total', 'counter',
+                 'Backends evicted by each worker.')
+monitor.describe('wmchack_jobs_running', 'gauge',
+                 'Background jobs submitted by each worker not yet done.')
+
+
+@monitor.collector
+def cache_samples():
+    stats = cache.stats()
+    return [('wmchack_callback_cache_lookups_total', {'result': 'hit'},
+             stats['hits']),
+            ('wmchack_callback_cache_lookups_total', {'result': 'miss'},
+             stats['misses']),
+            ('wmchack_callback_cache_hit_ratio', {}, stats['hit_rate']),
+            ('wmchack_callback_cache_bytes', {}, stats['mb']*2**20)]
+
+
+def worker_samples():
+    rss_mb = profiling.rss_mb()
+    return ([('process_resident_memory_bytes', {},
+              None if rss_mb is None else rss_mb*2**20),
+             ('wmchack_backend_loads_total', {}, pool.n_loads),
+             ('wmchack_backend_evictions_total', {}, pool.n_evictions),
+             ('wmchack_jobs_running', {}, runner.n_running())]
+            + [('wmchack_backend_bytes', {'corpus': corpus_id}, mb*2**20)
+               for corpus_id, mb in pool.footprints_mb().items()])
+
+monitor.collector(worker_samples, per_process=True)
+
+
+@app.server.route('/metrics')
+def serve_metrics():
+    return flask.Response(monitor.render(),
+                          content_type=metrics.CONTENT_TYPE)
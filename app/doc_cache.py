@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: persistent content-addressed cache of cleaned and tokenized
+#          vacancy descriptions, used by analysis.read_corpus_cached.
+
+import numpy as np
+import hashlib
+import sqlite3
+import sys
+import time
+
+
+class DocumentCache:
+    ''' SQLite-backed cache of token-id arrays keyed by document content.
+
+        Keys hash a description's text together with the normalizer
+        version, so edited descriptions and changes to clean/tokenize/
+        stopword filtering both miss. Tokens are stored as int32 ids into
+        a vocabulary table shared by all entries. When the entries and the
+        vocabulary together exceed max_mb, least recently used entries are
+        evicted on commit, along with tokens no remaining entry uses.
+
+        Use as
+            with DocumentCache('doc_cache.sqlite') as cache:
+                tokens = cache.get(key)
+    '''
+
+    def __init__(self, filepath: str, normalizer_version: str, max_mb=512):
+        self.normalizer_version = normalizer_version
+        self.max_bytes = int(max_mb*2**20)
+        self.n_hits = 0
+        self.n_misses = 0
+        self.conn = sqlite3.connect(filepath)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS vocab (
+                id INTEGER PRIMARY KEY, token TEXT UNIQUE);
+            CREATE TABLE IF NOT EXISTS docs (
+                key TEXT PRIMARY KEY, raw BLOB, words BLOB,
+                nbytes INTEGER, last_used REAL);
+            CREATE INDEX IF NOT EXISTS docs_last_used ON docs (last_used);
+        ''')
+        # interned, as analysis.tokenize does, so corpora share tokens; ids
+        # of evicted tokens are not reused, leaving None in their place
+        rows = self.conn.execute('SELECT id, token FROM vocab').fetchall()
+        self.vocab = [None]*(max([i for i, _ in rows], default=-1) + 1)
+        for i, t in rows:
+            self.vocab[i] = sys.intern(t)
+        self.vocab_i = {t: i for i, t in enumerate(self.vocab) if t is not None}
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.commit()
+        self.conn.close()
+
+
+    def key(self, file_string: str):
+        ''' Returns content hash identifying file_string's tokenization.
+        '''
+        h = hashlib.sha1(self.normalizer_version.encode('utf-8'))
+        h.update(file_string.encode('utf-8'))
+        return h.hexdigest()
+
+
+    def get(self, key: str):
+        ''' Returns (raw_tokens, filtered_tokens) cached under key, or None.
+        '''
+        row = self.conn.execute('SELECT raw, words FROM docs WHERE key = ?',
+                                (key,)).fetchone()
+        if row is None:
+            self.n_misses += 1
+            return None
+        self.n_hits += 1
+        self.conn.execute('UPDATE docs SET last_used = ? WHERE key = ?',
+                          (time.time(), key))
+        return tuple([self.vocab[i] for i in np.frombuffer(blob, np.int32)]
+                     for blob in row)
+
+
+    def put(self, key: str, raw_tokens: list, filtered_tokens: list):
+        raw, words = self.__encode(raw_tokens), self.__encode(filtered_tokens)
+        self.conn.execute('INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?, ?)',
+                          (key, raw, words, len(raw) + len(words), time.time()))
+
+
+    def commit(self):
+        ''' Evicts least recently used entries down to max_mb and commits.
+
+            The vocabulary is counted at its size before eviction, so
+            slightly more entries than needed may be evicted.
+        '''
+        total = self.nbytes()
+        if total > self.max_bytes:
+            evict = []
+            for key, nbytes in self.conn.execute(
+                    'SELECT key, nbytes FROM docs ORDER BY last_used'):
+                if total <= self.max_bytes:
+                    break
+                evict.append((key,))
+                total -= nbytes
+            self.conn.executemany('DELETE FROM docs WHERE key = ?', evict)
+            self.__evict_unused_tokens()
+        self.conn.commit()
+
+
+    def nbytes(self):
+        ''' Returns stored size of entries and vocabulary, in bytes.
+        '''
+        return self.conn.execute('''
+            SELECT (SELECT IFNULL(SUM(nbytes), 0) FROM docs)
+                 + (SELECT IFNULL(SUM(LENGTH(CAST(token AS BLOB)) + 4), 0)
+                    FROM vocab)
+        ''').fetchone()[0]
+
+
+    def __evict_unused_tokens(self):
+        used = np.zeros(len(self.vocab), dtype=bool)
+        for row in self.conn.execute('SELECT raw, words FROM docs'):
+            for blob in row:
+                used[np.frombuffer(blob, np.int32)] = True
+        unused = [i for i in np.flatnonzero(~used).tolist()
+                  if self.vocab[i] is not None]
+        self.conn.executemany('DELETE FROM vocab WHERE id = ?',
+                              [(i,) for i in unused])
+        for i in unused:
+            del self.vocab_i[self.vocab[i]]
+            self.vocab[i] = None
+
+
+    def __encode(self, tokens: list):
+        new_tokens = [t for t in dict.fromkeys(tokens) if t not in self.vocab_i]
+        for t in new_tokens:
+            self.vocab_i[t] = len(self.vocab)
+            self.vocab.append(t)
+        self.conn.executemany('INSERT INTO vocab VALUES (?, ?)',
+                              [(self.vocab_i[t], t) for t in new_tokens])
+        return np.array([self.vocab_i[t] for t in tokens],
+                        dtype=np.int32).tobytes()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: gunicorn settings for serving app.py from several worker
+#          processes, run from the directory containing the corpus with
+#          gunicorn --config gunicorn.conf.py app:server
+
+import multiprocessing
+import os
+import subprocess
+import sys
+
+# Import libraries (but no data) before forking, so workers share their
+# pages instead of each importing private copies
+import backends
+import viz
+
+bind = os.environ.get('WMCHACK_BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('WMCHACK_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('WMCHACK_THREADS', 4))
+timeout = 120
+
+# Workers import app.py themselves rather than forking a preloaded copy:
+# forked Python objects are unshared page by page as refcounts change,
+# whereas every worker memory maps the same read-only artifact store, so
+# its arrays are held once in the page cache however many workers run.
+preload_app = False
+
+
+def on_starting(server):
+    # build the artifact store of each corpus served (see dashboard.py) once,
+    # before any worker loads it, in a subprocess so the master process
+    # stays small
+    args = backends.build_args(backends.options_from_environ())
+    for corpus_id in os.environ.get('WMCHACK_CORPORA', 'uk').split(','):
+        subprocess.run([sys.executable, os.path.join(os.path.dirname(
+                            os.path.abspath(__file__)), 'viz.py'), corpus_id]
+                       + args, check=True)
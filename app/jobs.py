@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: background jobs for expensive analyses, run in a process pool so
+#          Dash callbacks return at once, serving the last result (stale
+#          while revalidate) until the fresh one is ready. Pool processes
+#          only load artifact stores built by gunicorn.conf.py or viz.py.
+
+import backends
+import callback_cache
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import threading
+import time
+
+_worker_pool = None # BackendPool set in each pool process by __init_worker
+
+# status is 'done', 'running' or 'failed'; value is the fresh result when
+# done, else the last result computed for the same arguments (or None)
+JobResult = namedtuple('JobResult', ['value', 'status', 'elapsed_s'])
+
+
+class JobFailed:
+    ''' Cached for a short time in place of the result of a job that raised.
+    '''
+
+    def __init__(self, message: str):
+        self.message = message
+
+
+def __init_worker(corpus_ids, options):
+    # jobs fail rather than build a missing or stale store, which the
+    # server builds once
+    global _worker_pool
+    _worker_pool = backends.BackendPool(corpus_ids, build=False, **options)
+
+
+def jacard_figure(corpus_id: str, fileid_1: str, fileid_2: str):
+    be = _worker_pool.get(corpus_id)
+    return json.loads(be.viz.graph.scatter_jacard(be.data, fileid_1,
+                                                  fileid_2).to_json())
+
+
+def start_runner(cache: callback_cache.CallbackCache, corpus_ids: list,
+                 n_jobs=2, failure_ttl_s=30, **options):
+    ''' Returns JobRunner whose processes serve corpus_ids from a
+        backends.BackendPool with options, which only loads current
+        artifact stores: jobs needing a missing or stale one fail.
+    '''
+    return JobRunner(cache, n_jobs=n_jobs, failure_ttl_s=failure_ttl_s,
+                     initializer=__init_worker, initargs=(corpus_ids, options))
+
+
+class JobRunner:
+    ''' Runs functions in a process pool, deduplicated per key.
+
+        Results are kept in a callback_cache.CallbackCache, so every
+        server worker sharing the cache sees them. A key is computed by
+        one job at a time across those workers: the worker submitting it
+        claims the key in the cache and others report it as running.
+        Each result is also cached under its name and arguments without
+        the version, and served as the stale value while a newer version
+        computes. Errors of failed jobs are cached for failure_ttl_s only,
+        after which the job is run again. Only the first request of a
+        result counts as a cache hit or miss, not the polls that follow.
+
+        Pool processes are spawned rather than forked, on first use, so
+        the runner may be created before a server forks or starts threads.
+
+        Use as
+            runner = start_runner(cache, ['uk'])
+            job = runner.result('jacard_figure', be.version,
+                                ('uk', fileid_1, fileid_2), jacard_figure)
+            if job.status != 'done': # poll again later, with poll=True
+    '''
+
+    def __init__(self, cache: callback_cache.CallbackCache, n_jobs=2,
+                 initializer=None, initargs=(), timeout_s=600,
+                 failure_ttl_s=30):
+        self.cache = cache
+        self.n_jobs = n_jobs
+        self.initializer = initializer
+        self.initargs = initargs
+        self.timeout_s = timeout_s
+        self.failure_ttl_s = failure_ttl_s
+        self.pool = None
+        self.futures = {} # key -> Future of jobs submitted by this worker
+        self.lock = threading.Lock()
+
+
+    def result(self, name: str, version: str, args: tuple, fnc, poll=False):
+        ''' Returns JobResult of fnc(*args), submitting a job if needed.
+
+            Args:
+                name: name of the result, e.g. of the callback needing it.
+                version: version of the data fnc reads, e.g. Backend.version.
+                args: picklable arguments of fnc.
+                fnc: module-level function, so pool processes can import it.
+                poll: whether this is a repeated request for a result not
+                    done when first requested, not counted by the cache.
+        '''
+        key = self.cache.key(name, (version,) + tuple(args))
+        found, value = self.cache.peek(key)
+        if not poll:
+            self.cache.count(found and not isinstance(value, JobFailed))
+        if found:
+            if isinstance(value, JobFailed):
+                return JobResult(value.message, 'failed', None)
+            return JobResult(value, 'done', None)
+
+        latest_key = self.cache.key(name, tuple(args))
+        self.__submit(key, latest_key, fnc, args)
+        _, stale = self.cache.peek(latest_key)
+        claimed_at = self.cache.claimed_at(key)
+        return JobResult(stale, 'running',
+                         None if claimed_at is None
+                         else time.time() - claimed_at)
+
+
+    def __submit(self, key, latest_key, fnc, args):
+        with self.lock:
+            if key in self.futures or not self.cache.claim(key,
+                                                           self.timeout_s):
+                return # already running, here or in another worker
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(
+                                max_workers=self.n_jobs,
+                                mp_context=multiprocessing.get_context('spawn'),
+                                initializer=self.initializer,
+                                initargs=self.initargs)
+            future = self.pool.submit(fnc, *args)
+            self.futures[key] = future
+        future.add_done_callback(
+            lambda f: self.__finish(key, latest_key, f))
+
+
+    def __finish(self, key, latest_key, future):
+        try:
+            value = future.result()
+        except Exception as e:
+            self.cache.put(key, JobFailed('{}: {}'.format(type(e).__name__,
+                                                          e)),
+                           ttl_s=self.failure_ttl_s)
+        else:
+            self.cache.put(key, value)
+            self.cache.put(latest_key, value)
+        finally:
+            self.cache.release(key)
+            with self.lock:
+                del self.futures[key]
+
+
+    def n_running(self):
+        ''' Returns number of jobs submitted by this worker not yet done.
+        '''
+        with self.lock:
+            return len(self.futures)
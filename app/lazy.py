@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: lazily computed, cached attributes with dependency tracking,
+#          used by viz.Backend.Data.
+
+import threading
+
+
+class Producer:
+    ''' Method computing one or more attributes from its dependencies.
+    '''
+
+    def __init__(self, fnc, names: tuple, deps: tuple):
+        self.fnc = fnc
+        self.names = names
+        self.deps = deps
+
+
+def produces(*names, deps=()):
+    ''' Marks a method of a LazyAttributes subclass as computing names.
+
+        The method returns one value per name and may read the attributes
+        listed in deps, which are computed first.
+    '''
+    def decorator(fnc):
+        fnc.producer = Producer(fnc, names, tuple(deps))
+        return fnc
+    return decorator
+
+
+class LazyAttributes:
+    ''' Mixin whose attributes are computed on first access and cached.
+
+        Computed attributes live in the instance __dict__, so once they
+        exist __getattr__ is no longer consulted and access costs nothing
+        extra. Attributes set directly (e.g. loaded from an artifact
+        store) are never recomputed. Each producer has its own lock, so
+        attributes may be computed concurrently from several threads,
+        e.g. by prefetch in the background while a request reads others.
+    '''
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._producers = [v.producer for v in cls.__dict__.values()
+                          if hasattr(v, 'producer')]
+        cls._producer_of = {name: p for p in cls._producers
+                            for name in p.names}
+
+
+    def _init_lazy(self):
+        self._locks = {p: threading.Lock() for p in self._producers}
+
+
+    def __getattr__(self, name):
+        # only called when name is not yet in the instance __dict__
+        producer = type(self)._producer_of.get(name)
+        if name.startswith('_') or producer is None:
+            raise AttributeError('{} has no attribute \'{}\''.format(
+                                    type(self).__name__, name))
+        self._compute(producer)
+        return self.__dict__[name]
+
+
+    def _compute(self, producer: Producer):
+        for dep in producer.deps: # outside lock, deps have their own
+            getattr(self, dep)
+        with self._locks[producer]:
+            if all(name in self.__dict__ for name in producer.names):
+                return # computed by another thread while we waited
+            values = producer.fnc(self)
+            if len(producer.names) == 1:
+                values = (values,)
+            self.__dict__.update(zip(producer.names, values))
+
+
+    def is_computed(self, *names):
+        ''' Whether names (default: every lazy attribute) are computed.
+        '''
+        return all(name in self.__dict__
+                   for name in (names or self._producer_of))
+
+
+    def compute(self, names=None):
+        ''' Computes names (default: every lazy attribute) now.
+        '''
+        for name in (names or list(self._producer_of)):
+            getattr(self, name)
+
+
+    def prefetch(self, names=None, callback=None):
+        ''' Computes names in a background daemon thread.
+
+            callback, if given, is called with self once they are done.
+        '''
+        def run():
+            self.compute(names)
+            if callback is not None:
+                callback(self)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+    def invalidate(self, *names):
+        ''' Discards names and every attribute computed from them.
+        '''
+        stale = set(names)
+        for p in self._producers: # producers are declared in dependency order
+            if stale.intersection(p.names) or stale.intersection(p.deps):
+                stale.update(p.names)
+        for name in stale:
+            self.__dict__.pop(name, None)
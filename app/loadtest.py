@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: load test of a running app.py server; replays keyword searches
+#          and file clicks against its Dash callbacks and reports requests
+#          per second, latency and the memory of each worker process.
+
+import artifacts
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import time
+import urllib.request
+
+try:
+    import psutil
+except ImportError: # worker memory is then not reported
+    psutil = None
+
+
+def callback_payload(inputs: dict, outputs: list, state=None):
+    ''' Returns body of a POST to /_dash-update-component.
+
+        Args:
+            inputs: dict of 'component_id.property' -> value.
+            outputs: list of 'component_id.property'.
+            state: dict of 'component_id.property' -> value, or None.
+    '''
+    split = lambda s: dict(zip(['id', 'property'], s.split('.')))
+    if len(outputs) == 1:
+        output, output_specs = outputs[0], split(outputs[0])
+    else:
+        output = '..' + '...'.join(outputs) + '..'
+        output_specs = [split(o) for o in outputs]
+    return {'output': output, 'outputs': output_specs,
+            'inputs': [dict(split(k), value=v) for k, v in inputs.items()],
+            'state': [dict(split(k), value=v)
+                      for k, v in (state or {}).items()],
+            'changedPropIds': list(inputs)[:1]}
+
+
+def click(fileid: str):
+    return {'points': [{'hovertext': fileid}]}
+
+
+def make_requests(corpus_id: str, n: int, random_state=0):
+    ''' Returns n (path, payload) pairs mixing the app's interactive
+        callbacks, drawn from the corpus's tokens and files.
+    '''
+    attrs = artifacts.ArtifactStore(os.path.join('artifacts',
+                                                 corpus_id)).load()
+    rs = np.random.RandomState(random_state)
+    tokens = [attrs['token_index'][j] for j in
+              rs.randint(len(attrs['token_index']), size=n)]
+    fileids = [attrs['fileid_index'][j] for j in
+               rs.randint(len(attrs['fileid_index']), size=n)]
+    corpus = {'dropdown-corpus.value': corpus_id}
+    kinds = [
+        lambda k: callback_payload({'input-wordsearch.n_submit': 1,
+                                    'input-wordsearch.n_blur': None,
+                                    **corpus},
+                                   ['div-wordsearch-confirm.children',
+                                    'div-wordsearch-table.children'],
+                                   state={'input-wordsearch.value': tokens[k]}),
+        lambda k: callback_payload({'input-wordsearch.value': tokens[k][:2]},
+                                   ['datalist-wordsearch.children'],
+                                   state=corpus),
+        lambda k: callback_payload({'graph-pca.clickData': click(fileids[k]),
+                                    **corpus},
+                                   ['markdown-pca.children']),
+        lambda k: callback_payload({'graph-pca.clickData': click(fileids[k]),
+                                    **corpus},
+                                   ['div-pca-similarfiles.children']),
+        lambda k: callback_payload(
+                    {'graph-jacardindex.clickData': click(fileids[k]),
+                     **corpus},
+                    ['markdown-jacardindex.children'])
+    ]
+    return [('/_dash-update-component', kinds[k % len(kinds)](k))
+            for k in range(n)]
+
+
+def send(url: str, path: str, payload: dict):
+    ''' Returns (latency in seconds, whether the response was 200).
+    '''
+    start = time.perf_counter()
+    req = urllib.request.Request(url + path,
+                                 data=json.dumps(payload).encode('utf-8'),
+                                 headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            resp.read()
+            ok = resp.status == 200
+    except OSError:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def worker_memory(master_pid: int):
+    ''' Returns list of (pid, rss_mb, uss_mb) of master_pid's children.
+
+        USS counts only pages unique to a process, so it excludes the
+        memory mapped artifact store shared by all workers.
+    '''
+    if psutil is None:
+        return []
+    rows = []
+    for p in psutil.Process(master_pid).children():
+        m = p.memory_full_info()
+        rows.append((p.pid, m.rss/2**20, m.uss/2**20))
+    return rows
+
+
+def run(url: str, requests: list, concurrency: int):
+    ''' Sends requests from concurrency threads and returns summary dict.
+    '''
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda r: send(url, *r), requests))
+    elapsed = time.perf_counter() - start
+    latencies = np.array([t for t, _ in results])
+    return {'n_requests': len(results),
+            'n_errors': sum(not ok for _, ok in results),
+            'requests_per_second': len(results)/elapsed,
+            'p50_ms': np.percentile(latencies, 50)*1e3,
+            'p95_ms': np.percentile(latencies, 95)*1e3}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Load tests a running app.py server; run from the '
+                    'directory containing the corpus and its artifacts.')
+    parser.add_argument('--url', default='http://127.0.0.1:8050')
+    parser.add_argument('--corpus-id', default='uk')
+    parser.add_argument('--n-requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--master-pid', type=int,
+                        help='gunicorn master pid, to report worker memory')
+    args = parser.parse_args()
+
+    requests = make_requests(args.corpus_id, args.n_requests)
+    run(args.url, requests[:args.concurrency], args.concurrency) # warm up
+    summary = run(args.url, requests, args.concurrency)
+    print('{n_requests:,} requests, {n_errors} errors: '
+          '{requests_per_second:,.0f} requests/second, '
+          'p50 {p50_ms:.0f} ms, p95 {p95_ms:.0f} ms'.format(**summary))
+    if args.master_pid:
+        for pid, rss, uss in worker_memory(args.master_pid):
+            print('worker {}: rss {:.0f} MB, uss {:.0f} MB'.format(pid, rss,
+                                                                  uss))
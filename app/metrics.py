@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: latency, error and resource metrics of a Dash app, collected from
+#          every server worker process and served in the Prometheus text
+#          format, used by dashboard.py.
+
+from dash.exceptions import PreventUpdate
+from collections import Counter
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# upper bounds in seconds of the callback latency histogram's buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+
+class Metrics:
+    ''' SQLite-backed metrics shared by the worker processes of a server.
+
+        Counters, e.g. the callback latency histogram, are accumulated in
+        each process and added to filepath every flush_s seconds by a
+        background thread, so processes opening the same filepath report
+        their totals. Collectors are functions returning samples, read
+        when metrics are rendered; samples of per-process collectors (e.g.
+        RSS) are instead written on flush, labelled with the process's pid,
+        and dropped once a process has not flushed for stale_s seconds.
+
+        Use as
+            metrics = Metrics('metrics.sqlite')
+            metrics.instrument(app) # once all callbacks are registered
+
+            @app.server.route('/metrics')
+            def serve_metrics():
+                return flask.Response(metrics.render(),
+                                      content_type=CONTENT_TYPE)
+    '''
+
+    def __init__(self, filepath: str, buckets=LATENCY_BUCKETS, flush_s=5.,
+                 stale_s=60.):
+        self.filepath = filepath
+        self.buckets = buckets
+        self.flush_s = flush_s
+        self.stale_s = stale_s
+        self.families = {} # metric name -> (type, help)
+        self.collectors = [] # (fnc, per_process)
+        self.pending = Counter() # (sample name, labels) -> increment
+        self.lock = threading.Lock()
+        self.local = threading.local() # sqlite connections are per thread
+        with self.__conn() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT, labels TEXT, value REAL,
+                    PRIMARY KEY (name, labels));
+                CREATE TABLE IF NOT EXISTS process_samples (
+                    name TEXT, labels TEXT, pid INTEGER, value REAL,
+                    updated REAL, PRIMARY KEY (name, labels, pid));
+            ''')
+        self.describe('dash_callback_latency_seconds', 'histogram',
+                      'Latency of Dash callbacks.')
+        self.describe('dash_callback_errors_total', 'counter',
+                      'Dash callbacks that raised an exception.')
+        threading.Thread(target=self.__flush_periodically, daemon=True).start()
+
+
+    def __conn(self):
+        if not hasattr(self.local, 'conn'):
+            self.local.conn = sqlite3.connect(self.filepath, timeout=30)
+            self.local.conn.execute('PRAGMA journal_mode=WAL')
+        return self.local.conn
+
+
+    def describe(self, name: str, kind: str, help_text: str):
+        ''' Declares metric name of Prometheus type kind, e.g. 'gauge'.
+        '''
+        self.families[name] = (kind, help_text)
+
+
+    def collector(self, fnc, per_process=False):
+        ''' Registers fnc, returning list of (name, labels dict, value)
+            samples of metrics declared with describe.
+
+            per_process collectors describe the calling process, e.g. its
+            memory, and are reported for every worker process.
+        '''
+        self.collectors.append((fnc, per_process))
+        return fnc
+
+
+    def inc(self, name: str, labels: dict, value=1.):
+        ''' Adds value to counter sample name{labels}.
+        '''
+        with self.lock:
+            self.pending[name, format_labels(labels)] += value
+
+
+    def observe(self, name: str, labels: dict, value: float):
+        ''' Records value in histogram name, e.g. a latency in seconds.
+        '''
+        with self.lock:
+            # buckets above value are added 0, so that every bucket is
+            # rendered from the first observation of labels on
+            for le in self.buckets:
+                self.pending[name + '_bucket',
+                             format_labels(dict(labels, le=le))] += int(
+                                 value <= le)
+            self.pending[name + '_bucket',
+                         format_labels(dict(labels, le='+Inf'))] += 1
+            self.pending[name + '_count', format_labels(labels)] += 1
+            self.pending[name + '_sum', format_labels(labels)] += value
+
+
+    def timed(self, fnc, name=None):
+        ''' Wraps fnc to record its latency and the exceptions it raises.
+        '''
+        labels = {'callback': name or fnc.__name__}
+
+        @functools.wraps(fnc)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fnc(*args, **kwargs)
+            except PreventUpdate: # Dash's way of not updating outputs
+                raise
+            except Exception:
+                self.inc('dash_callback_errors_total', labels)
+                raise
+            finally:
+                self.observe('dash_callback_latency_seconds', labels,
+                             time.perf_counter() - start)
+        return wrapper
+
+
+    def instrument(self, app):
+        ''' Times every callback registered with Dash app so far.
+        '''
+        for spec in app.callback_map.values():
+            spec['callback'] = self.timed(spec['callback'])
+
+
+    def __flush_periodically(self):
+        while True:
+            time.sleep(self.flush_s)
+            try:
+                self.flush()
+            except sqlite3.Error: # e.g. locked; counts are kept for next time
+                pass
+
+
+    def flush(self):
+        ''' Adds pending counts and per-process samples to filepath.
+        '''
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+        now = time.time()
+        pid = os.getpid()
+        samples = [(name, format_labels(dict(labels, pid=pid)), pid, value,
+                    now)
+                   for fnc, per_process in self.collectors if per_process
+                   for name, labels, value in fnc() if value is not None]
+        try:
+            with self.__conn() as conn:
+                conn.executemany('''
+                    INSERT INTO counters VALUES (?, ?, ?)
+                    ON CONFLICT (name, labels) DO UPDATE
+                        SET value = value + excluded.value''',
+                    [(name, labels, value)
+                     for (name, labels), value in pending.items()])
+                conn.execute('DELETE FROM process_samples WHERE pid = ?',
+                             (pid,))
+                conn.executemany('INSERT INTO process_samples '
+                                 'VALUES (?, ?, ?, ?, ?)', samples)
+        except sqlite3.Error:
+            with self.lock:
+                self.pending.update(pending)
+            raise
+
+
+    def render(self):
+        ''' Returns all metrics in the Prometheus text exposition format.
+        '''
+        self.flush()
+        with self.__conn() as conn:
+            conn.execute('DELETE FROM process_samples WHERE updated < ?',
+                         (time.time() - self.stale_s,))
+            samples = list(conn.execute('SELECT name, labels, value '
+                                        'FROM counters'))
+            samples += list(conn.execute('SELECT name, labels, value '
+                                         'FROM process_samples'))
+        samples += [(name, format_labels(labels), value)
+                    for fnc, per_process in self.collectors if not per_process
+                    for name, labels, value in fnc() if value is not None]
+
+        by_family = {}
+        for name, labels, value in samples:
+            family = next((f for f in [name, name.rsplit('_', 1)[0]]
+                           if f in self.families), name)
+            by_family.setdefault(family, []).append((name, labels, value))
+        lines = []
+        for family in sorted(by_family):
+            kind, help_text = self.families.get(family, ('untyped', ''))
+            lines += ['# HELP {} {}'.format(family, help_text),
+                      '# TYPE {} {}'.format(family, kind)]
+            lines += ['{}{} {}'.format(name, '{' + labels + '}' if labels
+                                       else '', format_value(value))
+                      for name, labels, value in sorted(by_family[family],
+                                                        key=sample_order)]
+        return '\n'.join(lines) + '\n'
+
+
+# content type of Metrics.render's output
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(labels: dict):
+    return ','.join('{}="{}"'.format(k, format_value(v) if k == 'le' else
+                                     str(v).replace('\\', '\\\\')
+                                           .replace('"', '\\"')
+                                           .replace('\n', '\\n'))
+                    for k, v in sorted(labels.items()))
+
+
+def format_value(value):
+    if isinstance(value, str):
+        return value
+    if value != value:
+        return 'NaN'
+    if abs(value) == float('inf'):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def sample_order(sample):
+    # histogram buckets in increasing order of le
+    name, labels, _ = sample
+    le = re.search(r'(^|,)le="([^"]*)"', labels)
+    return (name, re.sub(r'(^|,)le="[^"]*"', '', labels),
+            float(le.group(2)) if le else 0.)
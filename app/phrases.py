@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: matches dictionaries of multi-word phrases (e.g. FEDIP/GSS role
+#          definitions) against vacancy descriptions in one pass per file
+#          using an Aho-Corasick automaton.
+
+import analysis as an
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+_worker_matcher = None # set in each pool process by __init_worker
+
+
+def load_phrase_dictionary(csv_filepath: str):
+    ''' Reads phrase dictionary CSV with columns 'phrase' and 'group'.
+
+        Phrases are normalized with analysis.clean and whitespace is
+        collapsed, to match text built from read_corpus tokens. A phrase
+        may belong to several groups, with a row for each.
+    '''
+    df = pd.read_csv(csv_filepath, dtype=str)
+    df['phrase'] = df['phrase'].apply(lambda p: ' '.join(an.tokenize(an.clean(p))))
+    return df.drop_duplicates(['phrase', 'group']).reset_index(drop=True)
+
+
+class PhraseMatcher:
+    ''' Aho-Corasick automaton over a list of phrases.
+
+        Scanning a text visits each character once, however many phrases
+        there are. Matches must start and end on word boundaries, so
+        'bi' does not match inside 'biology'.
+
+        Repeated phrases, e.g. the phrases of a dictionary in which some
+        belong to several groups, are matched once; phrases holds each
+        distinct phrase in order of first appearance.
+    '''
+
+    def __init__(self, phrases: list):
+        self.phrases = list(dict.fromkeys(phrases))
+        self.phrase_lens = [len(p) for p in self.phrases]
+        self.goto = [{}] # goto[node][char] -> node
+        self.fail = [0]
+        self.out = [[]] # ids of phrases ending at node
+        for phrase_id, phrase in enumerate(self.phrases):
+            node = 0
+            for ch in phrase:
+                if ch not in self.goto[node]:
+                    self.goto[node][ch] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = self.goto[node][ch]
+            self.out[node].append(phrase_id)
+
+        # failure links point to the longest proper suffix in the trie
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(ch, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+
+    def count(self, text: str):
+        ''' Returns Counter of phrase ids matched in text.
+        '''
+        is_boundary = lambda k: k < 0 or k >= len(text) or not text[k].isalnum()
+        goto, fail, out = self.goto, self.fail, self.out
+        counts = Counter()
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for phrase_id in out[node]:
+                if (is_boundary(pos - self.phrase_lens[phrase_id])
+                        and is_boundary(pos + 1)):
+                    counts[phrase_id] += 1
+        return counts
+
+
+def __init_worker(matcher):
+    global _worker_matcher
+    _worker_matcher = matcher
+
+
+def __count_in_worker(text):
+    return _worker_matcher.count(text)
+
+
+def match_corpus(matcher: PhraseMatcher, texts: list, n_jobs=None,
+                 chunksize=64):
+    ''' Returns CSR matrix of phrase hit counts, texts x phrases.
+
+        Texts are matched across a process pool; the automaton is sent to
+        each worker once. On Windows, call from under
+        if __name__ == '__main__'.
+
+        Args:
+            matcher: PhraseMatcher.
+            texts: cleaned texts, e.g. from corpus_texts.
+            n_jobs: number of worker processes (None for one per CPU).
+            chunksize: texts sent to a worker at a time.
+    '''
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=__init_worker,
+                             initargs=(matcher,)) as pool:
+        counts = list(pool.map(__count_in_worker, texts, chunksize=chunksize))
+    rows = np.repeat(np.arange(len(counts)), [len(c) for c in counts])
+    cols = [phrase_id for c in counts for phrase_id in c.keys()]
+    data = [n for c in counts for n in c.values()]
+    return sps.csr_matrix((data, (rows, cols)),
+                          shape=(len(texts), len(matcher.phrases)),
+                          dtype=np.int32)
+
+
+def corpus_texts(data):
+    ''' Returns cleaned text of each file of Backend.Data, in fileid order.
+    '''
+    return [' '.join(data.corpus_raw[fileid]) for fileid in data.fileid_index]
+
+
+def phrase_group_matrix(phrases: list, df_phrases: pd.DataFrame):
+    ''' Returns indicator of each phrase's groups in df_phrases.
+
+        Returns:
+            m_phrase_group, groups: CSR matrix phrases x groups, 1 where
+                                    the phrase belongs to the group, and
+                                    its column labels.
+    '''
+    phrase_i = {p: j for j, p in enumerate(phrases)}
+    groups, group_ix = np.unique(df_phrases['group'], return_inverse=True)
+    m_phrase_group = sps.csr_matrix(
+        (np.ones(len(group_ix), dtype=np.int32),
+         (df_phrases['phrase'].map(phrase_i).values, group_ix.flatten())),
+        shape=(len(phrases), len(groups)))
+    return m_phrase_group, list(groups)
+
+
+def group_hits(m_hits, phrases: list, df_phrases: pd.DataFrame):
+    ''' Sums phrase hits by group, counting each hit of a phrase in every
+        group it belongs to.
+
+        Args:
+            m_hits: hit counts output by match_corpus.
+            phrases: phrases labelling m_hits' columns, i.e. the
+                     matcher's PhraseMatcher.phrases.
+            df_phrases: dictionary output by load_phrase_dictionary.
+
+        Returns:
+            m_group_hits, groups: CSR matrix texts x groups and its
+                                  column labels.
+    '''
+    m_phrase_group, groups = phrase_group_matrix(phrases, df_phrases)
+    return m_hits @ m_phrase_group, groups
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: writes the similar words of many keywords at once, as shown one
+#          keyword at a time by the dashboard's similar words table.
+# Usage:
+#   python profiles.py corpus_id keywords.txt profiles.feather
+
+import analysis as an
+import argparse
+import time
+
+
+def read_keywords(filepath: str):
+    ''' Returns keywords of a text file, one per line, lower cased as the
+        corpus tokens are. Blank lines are skipped.
+    '''
+    with open(filepath, encoding='utf-8') as f:
+        return [line.strip().lower() for line in f if line.strip()]
+
+
+if __name__ == '__main__':
+    import viz
+
+    parser = argparse.ArgumentParser(
+        description='Writes similar words of keywords listed in a file.')
+    parser.add_argument('corpus_id')
+    parser.add_argument('keywords_txt', help='one keyword per line')
+    parser.add_argument('profiles_file', help='.feather or .csv file')
+    parser.add_argument('--n-tokens', type=int, default=10,
+                        help='similar words kept per keyword')
+    args = parser.parse_args()
+
+    data = viz.Backend.Data(args.corpus_id)
+    keywords = read_keywords(args.keywords_txt)
+    start = time.perf_counter()
+    df_profiles = an.keyword_profiles(keywords, data.token_i,
+                                      data.token_index, data.s_tfidf,
+                                      N=args.n_tokens)
+    an.write_keyword_profiles(df_profiles, args.profiles_file)
+    print('Profiled {:,} keywords in {:.2f} seconds'.format(
+            df_profiles['Keyword'].nunique() if len(df_profiles) else 0,
+            time.perf_counter() - start))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: per-stage timing and memory profiling of Backend construction
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+from sparse_matrix import DualMatrix
+from contextlib import contextmanager
+import json
+import sys
+import time
+import tracemalloc
+
+try:
+    import psutil
+except ImportError: # fall back to resource, which is unavailable on Windows
+    psutil = None
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+
+def rss_mb():
+    ''' Returns resident set size of this process in MB, or None.
+
+        Without psutil this is the peak RSS so far, as reported by
+        getrusage.
+    '''
+    if psutil is not None:
+        return psutil.Process().memory_info().rss/2**20
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss/2**20 if sys.platform == 'darwin' else maxrss/2**10
+    return None
+
+
+def sizeof(obj, seen=None):
+    ''' Returns approximate number of bytes held by obj and its contents.
+
+        Counts array buffers of numpy, scipy.sparse and DualMatrix objects
+        and recurses into dicts, lists, tuples and sets and the attributes
+        of other objects, e.g. artifacts.StringArray. Objects reachable
+        twice, such as interned strings, are counted once.
+    '''
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, (np.ndarray, DualMatrix)):
+        return obj.nbytes
+    if sps.issparse(obj):
+        return sum(getattr(obj, attr).nbytes
+                   for attr in ['data', 'indices', 'indptr', 'row', 'col']
+                   if hasattr(obj, attr))
+    if isinstance(obj, (pd.Series, pd.DataFrame)):
+        return int(np.sum(obj.memory_usage(deep=True)))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sizeof(k, seen) + sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(sizeof(v, seen) for v in obj)
+    elif hasattr(obj, '__dict__'):
+        size += sizeof(vars(obj), seen)
+    return size
+
+
+class StageProfiler:
+    ''' Records wall time, CPU time and memory of named build stages.
+
+        Use as
+            prof = StageProfiler()
+            with prof.stage('read_corpus'):
+                corpus_raw = an.read_corpus(corpus_id)
+        A disabled profiler's stages are no-ops, so callers need not
+        branch on whether profiling is on.
+    '''
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}
+        self.footprints = {}
+
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        rss_before = rss_mb()
+        # stages nest, e.g. a lazy attribute producing its dependencies, and
+        # callers may trace too, so tracing is left to whoever started it
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        traced_before, peak_before = tracemalloc.get_traced_memory()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall_s = time.perf_counter() - wall_start
+            cpu_s = time.process_time() - cpu_start
+            current, peak = tracemalloc.get_traced_memory()
+            if started:
+                tracemalloc.stop()
+            # the peak is not reset for a nested stage, so its own peak is
+            # only known if it exceeded the peak traced so far
+            peak_mb = ((peak - traced_before)/2**20
+                       if started or peak > peak_before else None)
+            rss_after = rss_mb()
+            self.stages[name] = {
+                'wall_s': wall_s,
+                'cpu_s': cpu_s,
+                'traced_peak_mb': peak_mb, # allocations during stage
+                'traced_net_mb': (current - traced_before)/2**20, # still held
+                'rss_delta_mb': (rss_after - rss_before
+                                 if rss_before is not None else None)
+            }
+
+
+    def record_footprints(self, obj):
+        ''' Records sizeof of every attribute of obj, e.g. Backend.Data.
+        '''
+        if not self.enabled:
+            return
+        seen = set() # attributes sharing objects are only counted once
+        for name, value in vars(obj).items():
+            if name.startswith('_'): # locks, options and the like
+                continue
+            self.footprints[name] = sizeof(value, seen)/2**20
+
+
+    def report(self):
+        return {'stages': self.stages, 'footprints_mb': self.footprints}
+
+
+    def write_json(self, filepath: str):
+        with open(filepath, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+
+    def format_table(self):
+        ''' Returns report as a plaintext table.
+        '''
+        fmt = lambda v: '{:>10.2f}'.format(v) if v is not None else '{:>10}'.format('-')
+        lines = ['{:<24}{:>10}{:>10}{:>10}{:>10}{:>10}'.format(
+                    'stage', 'wall_s', 'cpu_s', 'peak_mb', 'net_mb', 'rss_mb')]
+        for name, s in self.stages.items():
+            lines.append('{:<24}'.format(name) + ''.join(fmt(s[k]) for k in
+                         ['wall_s', 'cpu_s', 'traced_peak_mb', 'traced_net_mb',
+                          'rss_delta_mb']))
+        lines += ['', '{:<24}{:>10}'.format('attribute', 'size_mb')]
+        for name, size in sorted(self.footprints.items(), key=lambda kv: -kv[1]):
+            lines.append('{:<24}'.format(name) + fmt(size))
+        return '\n'.join(lines)
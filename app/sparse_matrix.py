@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: compact sparse matrix with fast row and column access, used for
+#          the term frequency and tf-idf matrices in analysis.py.
+
+import numpy as np
+import scipy.sparse as sps
+
+INDEX_DTYPE = np.int32
+VALUE_DTYPE = np.float32
+
+
+class DualMatrix:
+    ''' Sparse matrix holding both CSR and CSC views of the same data.
+
+        Indices are int32 and values float32. Rows (files) are sliced from
+        the CSR view and columns (tokens) from the CSC view, so neither
+        needs a scan of the whole matrix.
+    '''
+
+    def __init__(self, m):
+        ''' Args:
+                m: any scipy.sparse matrix.
+        '''
+        self.csr = self.__compact(sps.csr_matrix(m))
+        self.csc = self.__compact(self.csr.tocsc())
+
+
+    @classmethod
+    def from_coords(cls, rows, cols, data, shape):
+        ''' Builds matrix from parallel arrays of row, column and value.
+
+            Duplicate coordinates are summed.
+        '''
+        return cls(sps.coo_matrix((data, (rows, cols)), shape=shape))
+
+
+    @classmethod
+    def from_views(cls, csr, csc):
+        ''' Wraps existing compact CSR and CSC matrices without copying,
+            e.g. memory-mapped ones loaded by artifacts.ArtifactStore.
+        '''
+        m = cls.__new__(cls)
+        m.csr, m.csc = csr, csc
+        return m
+
+
+    @staticmethod
+    def __compact(m):
+        m.sum_duplicates() # also sorts indices
+        m.indices = m.indices.astype(INDEX_DTYPE)
+        m.indptr = m.indptr.astype(INDEX_DTYPE)
+        m.data = m.data.astype(VALUE_DTYPE)
+        return m
+
+
+    @property
+    def shape(self):
+        return self.csr.shape
+
+
+    @property
+    def nnz(self):
+        return self.csr.nnz
+
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for m in [self.csr, self.csc]
+                   for a in [m.data, m.indices, m.indptr])
+
+
+    def row(self, i: int):
+        ''' Returns (column indices, values) of row i's stored entries.
+        '''
+        start, end = self.csr.indptr[i], self.csr.indptr[i+1]
+        return self.csr.indices[start:end], self.csr.data[start:end]
+
+
+    def col(self, j: int):
+        ''' Returns (row indices, values) of column j's stored entries.
+        '''
+        start, end = self.csc.indptr[j], self.csc.indptr[j+1]
+        return self.csc.indices[start:end], self.csc.data[start:end]
+
+
+    def rows(self, ix):
+        ''' Returns CSR matrix of rows ix.
+        '''
+        return self.csr[ix]
+
+
+    def cols(self, ix):
+        ''' Returns CSC matrix of columns ix.
+        '''
+        return self.csc[:, ix]
+
+
+    def n_nonzero_by_col(self):
+        ''' Returns number of positive entries in each column.
+        '''
+        return np.bincount(self.csr.indices[self.csr.data > 0],
+                           minlength=self.shape[1])
+
+
+    def n_stored_by_col(self):
+        ''' Returns number of stored entries in each column, including
+            explicit zeros, e.g. tf-idf values of tokens featured in every
+            file.
+        '''
+        return np.diff(self.csc.indptr)
+
+
+    def n_nonzero_by_row(self):
+        ''' Returns number of positive entries in each row.
+        '''
+        return np.bincount(self.csc.indices[self.csc.data > 0],
+                           minlength=self.shape[0])
+
+
+    def map_values(self, fnc):
+        ''' Returns DualMatrix with same sparsity and values fnc(data, cols).
+
+            fnc receives the CSR data array and the column index of each
+            entry, e.g. lambda data, cols: data*idf[cols].
+        '''
+        m = self.csr.copy()
+        m.data = fnc(m.data, m.indices)
+        return DualMatrix(m)
@@ -4,19 +4,22 @@
 # Created: 9th November 2020
 # Author: Jerome Wynne (jeromewynne@das-ltd.co.uk)
 # Environment: wmchack
-# Summary: functions that return data directly displayed in app.py
+# Summary: functions that return data directly displayed in dashboard.py
 
 import pandas as pd
 import analysis as an
+import profiling
+import doc_cache
+import artifacts
+import lazy
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import dash_html_components as dhtml
-from sklearn.decomposition import TruncatedSVD
-from sklearn.preprocessing import normalize
 import pickle
 import numpy as np
 
+import argparse
 import json
 import os
 import glob
@@ -33,41 +36,355 @@ import glob
 #   tables
 #   markdown
 
+# figures depending only on the corpus, rendered once when the artifact store
+# is built rather than on every process start
+STATIC_FIGURES = ['line_cdf_n_tokens_in_corpus_raw', 'bar_pmf_token_lengths',
+                  'bar_cdf_most_common_tokens', 'scatter_pc_tfidf',
+                  'scatter_jacard']
+
+# Backend options locating caches, which do not change what is built, so
+# are left out of the key of artifact stores
+UNKEYED_OPTIONS = ['cache_filepath', 'stem_memo_filepath', 'profile']
+
+# files compared by the prerendered scatter_jacard of the 'uk' corpus
+JACARD_PAIR = ('916243993___Occupational Therapist.txt',
+               '916250258___Experienced Care Support Worker.txt')
+
+
+def default_jacard_pair(data):
+    ''' Returns the files compared by the prerendered scatter_jacard:
+        JACARD_PAIR if both are in data's corpus, else its first two files.
+    '''
+    if all(fileid in data.fileid_i for fileid in JACARD_PAIR):
+        return JACARD_PAIR
+    return (data.fileid_index[0],
+            data.fileid_index[min(1, len(data.fileid_index) - 1)])
+
+
+def df_limit(value: str):
+    ''' Returns document frequency limit value, as taken by
+        analysis.prune_vocabulary: a number of files if an int, e.g. '3',
+        else a fraction of files, e.g. '0.5'.
+    '''
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
 class Backend:
     ''' Object for retrieving data to be displayed by front end.
     '''
 
-    def __init__(self, corpus_id):
-
-        # init data
-        self.data = self.Data(corpus_id)
+    def __init__(self, corpus_id, n_neighbours=None, ngram_buckets=None,
+                 cache_filepath=None, stem=False, stem_memo_filepath=None,
+                 min_df=1, max_df=1.0, max_features=None, profile=False):
+
+        # init data, computed on first access; profiling computes it all now
+        profiler = profiling.StageProfiler(enabled=profile)
+        self.data = self.Data(corpus_id, n_neighbours=n_neighbours,
+                              ngram_buckets=ngram_buckets,
+                              cache_filepath=cache_filepath, stem=stem,
+                              stem_memo_filepath=stem_memo_filepath,
+                              min_df=min_df, max_df=max_df,
+                              max_features=max_features, profiler=profiler)
         self.viz = self.Viz()
-
-    class Data:
-        # wrapper for data used by visualizations
-        def __init__(self, corpus_id):
+        self.figures = {}
+        self.version = None # set by load_or_build
+        if profile:
+            self.data.compute()
+            profiler.record_footprints(self.data)
+            profiler.write_json(corpus_id + '_profile.json')
+            print(profiler.format_table())
+
+    @classmethod
+    def load_or_build(cls, corpus_id, artifact_dir, background=True,
+                      rebuild=False, **options):
+        ''' Returns Backend loaded from artifact_dir, or building if the
+            store is missing or stale, or rebuild is set, e.g. to profile
+            the build.
+
+            The store is keyed on a hash of the corpus files, the pipeline
+            version and options (other than UNKEYED_OPTIONS, which do not
+            change the result). When building in the
+            background, the returned Backend's data is computed on demand
+            and by a background thread, which saves the store and static
+            figures once everything is built.
+        '''
+        store = artifacts.ArtifactStore(artifact_dir)
+        key_options = {k: v for k, v in options.items()
+                       if k not in UNKEYED_OPTIONS}
+        key = artifacts.corpus_hash(corpus_id)
+        if rebuild or not store.is_current(key, key_options):
+            be = cls(corpus_id, **options)
+            be.version = artifacts.version(key, key_options)
+            save = lambda data: be.save(store, key, key_options)
+            if background:
+                be.data.prefetch(callback=save)
+            else:
+                be.data.compute()
+                save(be.data)
+            return be
+        return cls.__from_store(store, key, key_options)
+
+    @classmethod
+    def load(cls, corpus_id, artifact_dir, **options):
+        ''' Returns Backend loaded from artifact_dir, never building it:
+            raises ValueError if the store is missing or stale, e.g. in
+            processes that must not rebuild a store being built elsewhere.
+        '''
+        store = artifacts.ArtifactStore(artifact_dir)
+        key_options = {k: v for k, v in options.items()
+                       if k not in UNKEYED_OPTIONS}
+        key = artifacts.corpus_hash(corpus_id)
+        if not store.is_current(key, key_options):
+            raise ValueError('The artifact store of corpus \'{}\' is missing '
+                             'or stale; build it with viz.py'.format(corpus_id))
+        return cls.__from_store(store, key, key_options)
+
+    @classmethod
+    def __from_store(cls, store, corpus_hash, options):
+        be = cls.__new__(cls)
+        be.data = cls.Data.from_attributes(store.load(), options)
+        be.viz = cls.Viz()
+        be.figures = store.load_figures()
+        be.version = artifacts.version(corpus_hash, options)
+        return be
+
+    def save(self, store, corpus_hash, options):
+        ''' Saves data and rendered static figures to ArtifactStore store.
+        '''
+        self.figures.update(self.render_figures())
+        store.save(self.data.public_attributes(), corpus_hash, options,
+                   figures=self.figures)
+
+    def render_figures(self):
+        ''' Returns dict of STATIC_FIGURES as JSON compatible dicts.
+        '''
+        figures = {}
+        for name in STATIC_FIGURES:
+            fig = getattr(self.viz.graph, name)(self.data)
+            figures[name] = json.loads(fig.to_json())
+        return figures
+
+    def figure(self, name):
+        ''' Returns static figure name, rendering it if it was not loaded.
+        '''
+        if name not in self.figures:
+            self.figures[name] = getattr(self.viz.graph, name)(self.data)
+        return self.figures[name]
+
+    class Data(lazy.LazyAttributes):
+        # wrapper for data used by visualizations; each attribute is built
+        # by the method producing it the first time it is read
+        def __init__(self, corpus_id, n_neighbours=None, ngram_buckets=None,
+                     ngram_range=(2, 3), cache_filepath=None, stem=False,
+                     stem_memo_filepath=None, min_df=1, max_df=1.0,
+                     max_features=None, profiler=None):
+            self._init_lazy()
+            self._prof = profiler or profiling.StageProfiler(enabled=False)
+            self._options = dict(n_neighbours=n_neighbours,
+                                 ngram_buckets=ngram_buckets,
+                                 ngram_range=ngram_range,
+                                 cache_filepath=cache_filepath, stem=stem,
+                                 stem_memo_filepath=stem_memo_filepath,
+                                 min_df=min_df, max_df=max_df,
+                                 max_features=max_features)
             self.corpus_id = corpus_id
-            self.corpus_raw = an.read_corpus(corpus_id)
-            self.corpus_words = an.get_corpus_words(self.corpus_raw)
-            self.corpus_types = an.get_corpus_types(self.corpus_words)
-            self.n_files = an.n_fileids(self.corpus_raw)
-            self.n_words = an.n_words(self.corpus_raw)
-            self.token_index = an.get_token_index(self.corpus_types)
-            self.fileid_index = an.get_fileid_index(self.corpus_types)
-            self.token_i = {t: j for j, t in enumerate(self.token_index)}
-            self.fileid_i = {fi: j for j, fi in enumerate(self.fileid_index)}
-            (self.s_termfreq, self.s_tfidf) = an.tf_idf(self.corpus_types,
-                                                        self.corpus_words,
-                                                        self.fileid_index,
-                                                        self.token_index)
-            self.n_filt_tokens_by_file = an.n_tokens_by_file(self.corpus_words,
-                                                             self.fileid_index)
-            self.example_fileid  = self.get_example_fileid()
+
+
+        @classmethod
+        def from_attributes(cls, attrs, options=None):
+            ''' Returns Data with attributes attrs, e.g. from ArtifactStore.
+            '''
+            data = cls(attrs['corpus_id'], **(options or {}))
+            data.__dict__.update(attrs)
+            return data
+
+
+        def public_attributes(self):
+            ''' Returns dict of computed attributes, e.g. to save.
+            '''
+            return {k: v for k, v in vars(self).items()
+                    if not k.startswith('_')}
+
+
+        @lazy.produces('corpus_raw', 'corpus_words')
+        def _read_corpus(self):
+            prof, opts = self._prof, self._options
+            if opts['cache_filepath']:
+                # only re-tokenize files that changed since the last build
+                with prof.stage('read_corpus_cached'), doc_cache.DocumentCache(
+                        opts['cache_filepath'], an.NORMALIZER_VERSION) as cache:
+                    return an.read_corpus_cached(self.corpus_id, cache)
+            with prof.stage('read_corpus'):
+                corpus_raw = an.read_corpus(self.corpus_id)
+            with prof.stage('get_corpus_words'):
+                corpus_words = an.get_corpus_words(corpus_raw)
+            return corpus_raw, corpus_words
+
+
+        @lazy.produces('corpus_types', deps=['corpus_words'])
+        def _corpus_types(self):
+            with self._prof.stage('get_corpus_types'):
+                return an.get_corpus_types(self.corpus_words)
+
+
+        @lazy.produces('n_files', 'n_words', deps=['corpus_raw'])
+        def _corpus_counts(self):
+            with self._prof.stage('corpus_counts'):
+                return an.n_fileids(self.corpus_raw), an.n_words(self.corpus_raw)
+
+
+        @lazy.produces('fileid_index', 'fileid_i', deps=['corpus_types'])
+        def _fileid_index(self):
+            with self._prof.stage('fileid_index'):
+                fileid_index = an.get_fileid_index(self.corpus_types)
+                return fileid_index, {fi: j for j, fi in enumerate(fileid_index)}
+
+
+        @lazy.produces('token_index', 'token_i', 'pruning_report',
+                       's_termfreq', 's_tfidf',
+                       deps=['corpus_types', 'corpus_words', 'fileid_index'])
+        def _tf_idf(self):
+            # the vocabulary is final only after stemming merges columns and
+            # pruning drops them by document frequency, so it is built with
+            # the matrices; pruning comes last, so that a stem's variants
+            # are judged by their merged document frequency
+            prof, opts = self._prof, self._options
+            with prof.stage('token_index'):
+                token_index = an.get_token_index(self.corpus_types)
+                token_i = {t: j for j, t in enumerate(token_index)}
+            with prof.stage('term_frequency'):
+                s_termfreq = an.term_frequency(self.corpus_types,
+                                               self.corpus_words,
+                                               self.fileid_index, token_index)
+            # optionally merge tokens sharing a stem, e.g. analyst/analysts
+            if opts['stem']:
+                with prof.stage('stem_vocabulary'):
+                    stems = an.stem_vocabulary(token_index,
+                                               memo_filepath=opts[
+                                                   'stem_memo_filepath'])
+                    (s_termfreq, merged_token_index,
+                     mapping) = an.merge_token_columns(s_termfreq,
+                                                       token_index, stems)
+                    # every surface form still looks up its merged column
+                    token_i = {t: int(mapping[j])
+                               for j, t in enumerate(token_index)}
+                    token_index = merged_token_index
+            pruning_report = None
+            if (opts['min_df'], opts['max_df'],
+                    opts['max_features']) != (1, 1.0, None):
+                # drop rare and ubiquitous tokens
+                with prof.stage('prune_vocabulary'):
+                    n_cols = s_termfreq.shape[1]
+                    (s_termfreq, token_index, kept,
+                     pruning_report) = an.prune_vocabulary(
+                                            s_termfreq, token_index,
+                                            min_df=opts['min_df'],
+                                            max_df=opts['max_df'],
+                                            max_features=opts['max_features'])
+                    new_col = np.full(n_cols, -1)
+                    new_col[kept] = np.arange(len(kept))
+                    token_i = {t: int(new_col[j]) for t, j in token_i.items()
+                               if new_col[j] >= 0}
+            with prof.stage('tf_idf'):
+                s_tfidf = an.weight_by_idf(s_termfreq)
+            return token_index, token_i, pruning_report, s_termfreq, s_tfidf
+
+
+        @lazy.produces('corpus_stats', 'n_filt_tokens_by_file',
+                       deps=['corpus_raw', 'corpus_words', 'fileid_index'])
+        def _corpus_statistics(self):
+            with self._prof.stage('corpus_statistics'):
+                corpus_stats = an.corpus_statistics(self.corpus_raw,
+                                                    self.corpus_words,
+                                                    self.fileid_index)
+                return corpus_stats, corpus_stats['n_tokens_filt_by_file']
+
+
+        @lazy.produces('n_files_w_token', deps=['s_termfreq'])
+        def _document_frequency(self):
+            # number of files featuring each token, ranking completions
+            with self._prof.stage('document_frequency'):
+                return self.s_termfreq.n_nonzero_by_col()
+
+
+        @lazy.produces('token_assoc', deps=['s_tfidf'])
+        def _token_associations(self):
+            with self._prof.stage('token_associations'):
+                return an.token_associations(self.s_tfidf)
+
+
+        @lazy.produces('top_tokens', deps=['s_tfidf'])
+        def _top_tokens(self):
+            # each file's 20 highest tf-idf tokens, looked up on click
+            with self._prof.stage('top_k_by_row'):
+                return an.top_k_by_row(self.s_tfidf, k=20)
+
+
+        @lazy.produces('s_tfidf_norm', deps=['s_tfidf'])
+        def _l2_normalize(self):
+            with self._prof.stage('l2_normalize'):
+                return an.l2_normalize(self.s_tfidf)
+
+
+        @lazy.produces('svd_components', 'svd_coords', deps=['s_tfidf_norm'])
+        def _svd_embedding(self):
+            # 2d embedding of files, cached so figures need not refit it
+            with self._prof.stage('svd_embedding'):
+                return an.svd_embedding(self.s_tfidf_norm)
+
+
+        @lazy.produces('neighbours', deps=['s_tfidf_norm'])
+        def _nearest_neighbours(self):
+            # optionally precompute each file's nearest neighbours
+            n_neighbours = self._options['n_neighbours']
+            if not n_neighbours:
+                return None
+            with self._prof.stage('nearest_neighbours'):
+                return an.nearest_neighbours(self.s_tfidf_norm, k=n_neighbours)
+
+
+        @lazy.produces('s_ngram_termfreq', 's_ngram_tfidf', 'ngram_report',
+                       deps=['corpus_words', 'fileid_index'])
+        def _hashed_ngrams(self):
+            # optionally hash n-grams into a fixed number of tf-idf columns
+            opts = self._options
+            if not opts['ngram_buckets']:
+                return None, None, None
+            with self._prof.stage('hashed_ngrams'):
+                s_ngram_termfreq, n_ngrams = an.hashed_term_frequency(
+                                                self.corpus_words,
+                                                self.fileid_index,
+                                                n_buckets=opts['ngram_buckets'],
+                                                ngram_range=opts['ngram_range'])
+                return (s_ngram_termfreq, an.weight_by_idf(s_ngram_termfreq),
+                        an.ngram_collision_report(s_ngram_termfreq, n_ngrams))
+
+
+        @lazy.produces('documents',
+                       deps=['corpus_raw', 'corpus_words', 'fileid_index'])
+        def _documents(self):
+            # source text and token views of every file, for display
+            with self._prof.stage('documents'):
+                return artifacts.DocumentBlob.encode(
+                            self.fileid_index,
+                            an.read_source_texts(self.corpus_id,
+                                                 self.fileid_index),
+                            self.corpus_raw, self.corpus_words)
+
+
+        @lazy.produces('example_fileid', deps=['corpus_raw', 'fileid_index'])
+        def _example_fileid(self):
+            return self.get_example_fileid()
 
 
         def get_example_fileid(self):
-                return [k for k in list(self.corpus_raw.keys()) 
-                             if k == '915892388___Senior Staff Nurse.txt'][0]
+                # fall back to first file for corpora other than 'uk'
+                return next((k for k in list(self.corpus_raw.keys())
+                             if k == '915892388___Senior Staff Nurse.txt'),
+                            self.fileid_index[0])
 
 
     class Viz:
@@ -82,40 +399,50 @@ class Backend:
             def __init__(self): 
                 pass
 
-            def source_text(self, data, fileid):
-                fp = os.path.join('.', data.corpus_id, fileid)
-                with open(fp, 'r') as f:
-                    f_str = f.read()
-                return f_str
-
-            def raw_tokens_in_file(self, data, fileid):
-                return ', '.join(data.corpus_raw[fileid])
-
-            def filtered_tokens_in_file(self, data, fileid):
-                return ', '.join(data.corpus_words[fileid])
+            def document_page(self, data, fileid, view, start=0,
+                              max_bytes=None):
+                ''' Returns a page of one of fileid's views (see
+                    artifacts.DocumentBlob), marked ' …' if truncated.
+                '''
+                text, next_start = data.documents.get(fileid, view,
+                                                      start=start,
+                                                      max_bytes=max_bytes)
+                if next_start is None:
+                    return text
+                if view != 'text': # end on a whole token
+                    text = text[:text.rfind(', ')] if ', ' in text else text
+                return text + ' …'
+
+            def source_text(self, data, fileid, max_bytes=None):
+                return self.document_page(data, fileid, 'text',
+                                          max_bytes=max_bytes)
+
+            def raw_tokens_in_file(self, data, fileid, max_bytes=None):
+                return self.document_page(data, fileid, 'raw_tokens',
+                                          max_bytes=max_bytes)
+
+            def filtered_tokens_in_file(self, data, fileid, max_bytes=None):
+                return self.document_page(data, fileid, 'filtered_tokens',
+                                          max_bytes=max_bytes)
 
             def n_unique_tokens_in_raw(self, data):
-                return '{:,}'.format(len(set.union(
-                            *[set(txt) for txt in data.corpus_raw.values()]
-                        )))
+                return '{:,}'.format(data.corpus_stats['n_unique_raw_tokens'])
 
             def corpus_words(self, data, fileid):
                 ''' Returns string listing tokens in file.
                 '''
-                return ', '.join(data.corpus_words[fileid])
+                return self.filtered_tokens_in_file(data, fileid)
 
 
             def top_tfidf(self, data, fileid):
                 ''' Returns string listing file's words with highest tf-idf.
                 '''
-                i = data.fileid_i[fileid]
-                ser_tfidf = pd.Series(data.s_tfidf[i, :].todense(), 
-                                    index=data.token_index)
-                return ', '.join(ser_tfidf.nlargest(20).index)
+                ix = data.top_tokens[0][data.fileid_i[fileid]]
+                return ', '.join(data.token_index[j] for j in ix if j >= 0)
 
 
             def n_tokens_in_file(self, data, fileid):
-                return str(len(data.corpus_words[fileid]))
+                return str(data.n_filt_tokens_by_file[data.fileid_i[fileid]])
 
 
         class Graph:
@@ -126,8 +453,7 @@ class Backend:
 
 
             def line_cdf_n_tokens_in_corpus_raw(self, data):
-                x, P_x = an.cdf(an.n_tokens_by_file(data.corpus_raw,
-                                                    data.fileid_index))
+                x, P_x = data.corpus_stats['cdf_n_tokens_raw']
                 N_x = P_x*data.n_files # cumulative count
 
                 # create figure with secondary y-axis
@@ -154,10 +480,7 @@ class Backend:
             def bar_pmf_token_lengths(self, data):
                 ''' Returns frequency distribution of token lengths for corpus.
                 '''
-                ser_token_lens = pd.Series([len(t)
-                                            for fileid in data.corpus_words.keys() 
-                                            for t in data.corpus_words[fileid]])
-                ser_freq_dist = ser_token_lens.value_counts()                    
+                ser_freq_dist = data.corpus_stats['token_length_counts']
 
                 # create figure with secondary y-axis
                 fig = make_subplots(specs=[[{'secondary_y': True}]])
@@ -186,13 +509,9 @@ class Backend:
             def bar_cdf_most_common_tokens(self, data, N=100):
                 ''' Returns plot showing how many corpus tokens are of top N tokens.
                 '''
-                # get list of all tokens in filtered corpus
-                tokens = [t for fileid in data.corpus_words.keys()
-                          for t in data.corpus_words[fileid]]
-
                 # get token counts (as a proportion)
-                ser_token_c = pd.Series(tokens).value_counts() # c for count
-                n_words_in_corpus = ser_token_c.values.sum()
+                ser_token_c = data.corpus_stats['top_token_counts'] # c for count
+                n_words_in_corpus = data.corpus_stats['n_filt_tokens']
 
                 # get cumulative fraction of corpus
                 ser_token_p = ser_token_c.nlargest(N)/n_words_in_corpus
@@ -219,43 +538,39 @@ class Backend:
 
                 return fig
             
-            def scatter_pc_tfidf(self, data):
-                Xin = data.s_tfidf.tocsr() # to scipy sparse CSR format
-                Xin = normalize(Xin)
-                svd = TruncatedSVD(n_components=2)
-                svd.fit(Xin)
-                Xout = svd.transform(Xin)
-
-                df_display = pd.DataFrame({
-                                    'Latent dimension 1': Xout[:, 0],
-                                    'Latent dimension 2': Xout[:, 1],
-                                    'File id': data.fileid_index,
-                                    'File length': data.n_filt_tokens_by_file
-                                })
-                fig = px.scatter(df_display, x='Latent dimension 1',
-                                y='Latent dimension 2', hover_name='File id',
-                                color='File length',
-                                hover_data={
-                                    'Latent dimension 1': False,
-                                    'Latent dimension 2': False,
-                                    'File length': False
-                                })
-                fig.update_traces(marker=dict(size=5,
-                                line=dict(width=1,
-                                            color='white')),
-                                selector=dict(mode='markers'))
+            def scatter_pc_tfidf(self, data, x_range=None, y_range=None,
+                                 max_points=5000):
+                # WebGL scatter of the cached SVD embedding; dense regions
+                # are thinned to max_points, so zooming in (passing the
+                # visible x_range and y_range) shows more of them
+                coords = data.svd_coords
+                ix = an.downsample_points(coords, max_points=max_points,
+                                          x_range=x_range, y_range=y_range)
+                fig = go.Figure(go.Scattergl(
+                    x=coords[ix, 0], y=coords[ix, 1], mode='markers',
+                    hovertext=[data.fileid_index[i] for i in ix],
+                    hoverinfo='text',
+                    marker=dict(size=5,
+                                color=np.asarray(data.n_filt_tokens_by_file)[ix],
+                                showscale=True,
+                                colorbar=dict(title='File length'),
+                                line=dict(width=1, color='white'))
+                ))
                 fig.update_layout(
                     showlegend=False,
                     margin=go.layout.Margin(l=20, r=20, b=20, t=20),
-                    clickmode='event'
+                    clickmode='event',
+                    uirevision='scatter_pc_tfidf', # keep zoom on redraw
+                    xaxis=dict(title='Latent dimension 1', range=x_range),
+                    yaxis=dict(title='Latent dimension 2', range=y_range)
                 )
                 return fig
 
-                
-            def scatter_jacard(self, data):
-
-                fileid_1 = '916243993___Occupational Therapist.txt'
-                fileid_2 = '916250258___Experienced Care Support Worker.txt'
+            def scatter_jacard(self, data, fileid_1=None, fileid_2=None):
+                # files not given are those of default_jacard_pair
+                default_1, default_2 = default_jacard_pair(data)
+                fileid_1 = fileid_1 or default_1
+                fileid_2 = fileid_2 or default_2
 
                 # compute jacard_index(fileid_1, fileid) for all fileid
                 ser_ji_1 = an.jacard_index(s_tf=data.s_termfreq, 
@@ -295,10 +610,20 @@ class Backend:
                 pass
 
 
+            def token_suggestions(self, data, prefix, N=10):
+                # datalist options completing prefix, most frequent first
+                return [dhtml.Option(value=t) for t in an.complete_prefix(
+                            prefix, data.token_index,
+                            data.n_files_w_token, N=N)]
+
+
             def similar_words(self, data, keyword, N=10):
                 # get dataframe containing top N most similar words
-                df_similar = an.similar_words(keyword, data.token_i,
-                                              data.token_index, data.s_tfidf, N=N)
+                df_similar = an.similar_words_precomputed(keyword,
+                                                          data.token_i,
+                                                          data.token_index,
+                                                          data.token_assoc,
+                                                          N=N)
                 # format numeric cols to strings
                 for coln in df_similar.columns:
                     if coln not in ['Token', '# of files w token']:
@@ -312,6 +637,19 @@ class Backend:
                 return self.__generate_table(df_similar, max_rows=N)
 
 
+            def similar_files(self, data, fileid, N=20):
+                # get files with highest cosine similarity to fileid
+                ser_sim = an.similar_files(fileid, data.fileid_i,
+                                           data.fileid_index, data.s_tfidf_norm,
+                                           k=N, neighbours=data.neighbours)
+                df_similar = pd.DataFrame({
+                    'File id': ser_sim.index,
+                    'Cosine similarity': ser_sim.apply(
+                        lambda v: '{:4.2f}'.format(v)).values
+                })
+                return self.__generate_table(df_similar, max_rows=N)
+
+
             def __generate_table(self, dataframe, max_rows=10):
                 ''' From https://dash.plotly.com/layout
                 '''
@@ -329,3 +667,45 @@ class Backend:
                         for i in range(min(len(dataframe), max_rows))
                     ])
                 ], style={'font-size':'11px', 'width':'70%', 'margin':'auto'})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Builds the artifact store and static figures of a '
+                    'corpus, as loaded by app.py.')
+    parser.add_argument('corpus_id')
+    parser.add_argument('--n-neighbours', type=int, default=20)
+    parser.add_argument('--ngram-buckets', type=int,
+                        help='also hash n-grams into this many tf-idf columns')
+    parser.add_argument('--stem', action='store_true',
+                        help='merge tokens sharing a Porter stem')
+    parser.add_argument('--stem-memo', default='stem_memo.json',
+                        help='JSON file of stems kept across builds')
+    parser.add_argument('--min-df', type=df_limit, default=1,
+                        help='drop tokens in fewer files than this (an int) '
+                             'or fraction of files (a float)')
+    parser.add_argument('--max-df', type=df_limit, default=1.0,
+                        help='drop tokens in more files than this')
+    parser.add_argument('--max-features', type=int,
+                        help='keep only this many tokens, most frequent first')
+    parser.add_argument('--profile', action='store_true',
+                        help='rebuild, printing time and memory of each stage '
+                             'and writing them to <corpus_id>_profile.json')
+    args = parser.parse_args()
+
+    be = Backend.load_or_build(args.corpus_id,
+                               os.path.join('artifacts', args.corpus_id),
+                               background=False, rebuild=args.profile,
+                               profile=args.profile,
+                               n_neighbours=args.n_neighbours,
+                               ngram_buckets=args.ngram_buckets,
+                               stem=args.stem,
+                               stem_memo_filepath=args.stem_memo,
+                               min_df=args.min_df, max_df=args.max_df,
+                               max_features=args.max_features,
+                               cache_filepath=args.corpus_id
+                                              + '_doc_cache.sqlite')
+    if be.data.pruning_report is not None:
+        print(an.format_pruning_report(be.data.pruning_report))
+    if be.data.ngram_report is not None:
+        print(an.format_ngram_report(be.data.ngram_report))
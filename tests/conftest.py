@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Environment: wmchack
+# Summary: shared fixtures of the tests; app/ modules import each other as
+#          top-level modules, so it is put on the path as app.py runs them.
+#          Tokenizing needs the NLTK stopwords corpus (NLTK_DATA).
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'app'))
+
+import pytest
+
+# a few vacancies, none of them in the 'uk' corpus
+DESCRIPTIONS = {
+    '100000001___Data Analyst.txt':
+        'The data analyst will analyse data and report data to managers. '
+        'Analysts use SQL and Excel.',
+    '100000002___Senior Data Analyst.txt':
+        'A senior analyst analysing hospital data, building reports and '
+        'dashboards for managers.',
+    '100000003___Staff Nurse.txt':
+        'The staff nurse will care for patients on the ward and support '
+        'the ward manager.',
+    '100000004___Community Nurse.txt':
+        'Community nurses visit patients at home and care for patients '
+        'with long term conditions.',
+    '100000005___Occupational Therapist.txt':
+        'The occupational therapist will assess patients and support '
+        'their rehabilitation at home.',
+}
+
+
+@pytest.fixture
+def corpus_id(tmp_path, monkeypatch):
+    ''' Writes DESCRIPTIONS as corpus 'tiny' in a temporary working
+        directory, as analysis.write_corpus would, and returns its id.
+    '''
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('tiny')
+    for fileid, text in DESCRIPTIONS.items():
+        with open(os.path.join('tiny', fileid), 'w', encoding='utf-8') as f:
+            f.write(text)
+    return 'tiny'
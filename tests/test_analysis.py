@@ -0,0 +1,108 @@
+import analysis as an
+import viz
+from sparse_matrix import DualMatrix
+import numpy as np
+import os
+import pytest
+
+
+def termfreq(rows):
+    # DualMatrix of term frequencies from dense rows
+    return DualMatrix(np.array(rows, dtype=float))
+
+
+def test_merge_token_columns_sums_columns_sharing_a_stem():
+    token_index = ['analyse', 'analysing', 'analyst', 'nurse']
+    s_tf = termfreq([[1, 0, 2, 0],
+                     [0, 1, 0, 0],
+                     [0, 0, 1, 3]])
+    stems = ['analys', 'analys', 'analyst', 'nurs']
+    s_merged, merged_index, mapping = an.merge_token_columns(s_tf, token_index,
+                                                             stems)
+    assert merged_index == ['analyse', 'analyst', 'nurse']
+    assert list(mapping) == [0, 0, 1, 2]
+    assert s_merged.csr.toarray().tolist() == [[1, 2, 0], [1, 0, 0],
+                                              [0, 1, 3]]
+
+
+def test_prune_vocabulary_by_document_frequency():
+    token_index = ['a', 'b', 'c', 'd']
+    s_tf = termfreq([[1, 1, 0, 1],
+                     [1, 0, 0, 1],
+                     [1, 0, 1, 0],
+                     [1, 0, 0, 0]])
+    s_pruned, pruned_index, kept, report = an.prune_vocabulary(
+                                            s_tf, token_index, min_df=2,
+                                            max_df=0.9)
+    assert pruned_index == ['d'] and list(kept) == [3]
+    assert s_pruned.csr.toarray().ravel().tolist() == [1, 1, 0, 0]
+    assert report == {'n_tokens_before': 4, 'n_tokens_after': 1,
+                      'nnz_before': 8, 'nnz_after': 2}
+
+
+def test_prune_vocabulary_max_features_breaks_ties_by_token():
+    s_tf = termfreq([[1, 1, 1, 0], [1, 1, 1, 1]])
+    _, pruned_index, _, _ = an.prune_vocabulary(s_tf, ['a', 'b', 'c', 'd'],
+                                                max_features=2)
+    assert pruned_index == ['a', 'b']
+
+
+def test_pruning_judges_stems_by_merged_document_frequency(corpus_id):
+    # 'nurse' and 'nurses' are each in one file, but their stem is in two
+    # and should survive min_df=2
+    data = viz.Backend.Data(corpus_id, stem=True, min_df=2)
+    assert 'nurse' in data.token_i and 'nurses' in data.token_i
+    assert data.token_i['nurse'] == data.token_i['nurses']
+    assert len(data.token_index) == data.s_tfidf.shape[1]
+    assert data.pruning_report['n_tokens_after'] == len(data.token_index)
+    assert all(0 <= j < len(data.token_index) for j in data.token_i.values())
+    assert (data.s_termfreq.n_nonzero_by_col() >= 2).all()
+
+
+def test_similar_words_precomputed_matches_similar_words(corpus_id):
+    # 'vacancy' is featured in every file, so its tf-idf values are 0
+    for fileid in os.listdir(corpus_id):
+        with open(os.path.join(corpus_id, fileid), 'a', encoding='utf-8') as f:
+            f.write(' Vacancy.')
+    data = viz.Backend.Data(corpus_id)
+    j = data.token_i['vacancy']
+    assert not data.s_tfidf.col(j)[1].any()
+    n_tokens = len(data.token_index)
+    for token in ['vacancy', 'nurse', 'patients', 'data']:
+        df = an.similar_words(token, data.token_i, data.token_index,
+                              data.s_tfidf, N=n_tokens)
+        # tokens not featured in the keyword's files are not stored
+        df = df[df['% of keyword files w token'] > 0].set_index('Token')
+        df_pre = an.similar_words_precomputed(
+                    token, data.token_i, data.token_index, data.token_assoc,
+                    N=n_tokens).set_index('Token')
+        assert len(df_pre) > 0 and sorted(df_pre.index) == sorted(df.index)
+        df_pre = df_pre.loc[df.index]
+        for column in df.columns:
+            assert np.allclose(df_pre[column], df[column]), (token, column)
+    # the keyword is featured in all of its own files
+    row = an.similar_words_precomputed('vacancy', data.token_i,
+                                       data.token_index, data.token_assoc,
+                                       N=n_tokens).set_index('Token').loc[
+                                        'vacancy']
+    assert row['# of files w token'] == 5
+    assert row['% of keyword files w token'] == 100.
+
+
+def test_keyword_profiles_match_similar_words(corpus_id):
+    data = viz.Backend.Data(corpus_id)
+    keywords = ['nurse', 'patients', 'data', 'analyst', 'home']
+    with pytest.warns(UserWarning, match='zzzqqq'):
+        df_profiles = an.keyword_profiles(keywords + ['zzzqqq'],
+                                          data.token_i, data.token_index,
+                                          data.s_tfidf)
+    assert list(df_profiles['Keyword'].unique()) == keywords
+    for keyword, df_profile in df_profiles.groupby('Keyword', sort=False):
+        df = an.similar_words(keyword, data.token_i, data.token_index,
+                              data.s_tfidf)
+        assert list(df_profile['Token']) == list(df['Token'])
+        assert (df_profile['# of keyword files']
+                == len(data.s_tfidf.col(data.token_i[keyword])[0])).all()
+        for column in df.columns.drop('Token'):
+            assert np.allclose(df_profile[column], df[column]), (keyword,
+                                                                 column)
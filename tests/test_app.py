@@ -0,0 +1,14 @@
+import jobs
+import os
+import runpy
+import sys
+
+
+def test_job_processes_do_not_set_up_dashboard(monkeypatch):
+    # as spawned job processes re-import the script run by python app.py
+    monkeypatch.delitem(sys.modules, 'dashboard', raising=False)
+    namespace = runpy.run_path(os.path.join(os.path.dirname(jobs.__file__),
+                                            'app.py'),
+                               run_name='__mp_main__')
+    assert 'dashboard' not in sys.modules
+    assert 'server' not in namespace
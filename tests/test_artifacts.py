@@ -0,0 +1,74 @@
+import artifacts
+import viz
+import numpy as np
+import os
+import pandas as pd
+import scipy.sparse as sps
+from sparse_matrix import DualMatrix
+
+
+def attributes():
+    m = sps.csr_matrix(np.array([[1., 0., 2.], [0., 3., 0.]]))
+    return {'fileid_index': ['a.txt', 'b.txt'],
+            'fileid_i': {'a.txt': 0, 'b.txt': 1},
+            'corpus_words': {'a.txt': ['nurse', 'ward'], 'b.txt': ['data']},
+            'corpus_types': None,
+            'm_coords': np.arange(6.).reshape(2, 3),
+            's_tfidf': DualMatrix(m),
+            's_norm': m,
+            'df_counts': pd.Series([2, 1], index=['nurse', 'data']),
+            'pair': (np.arange(2), 'x'),
+            'n_files': np.int64(2)}
+
+
+def test_save_load_round_trip(tmp_path):
+    store = artifacts.ArtifactStore(str(tmp_path / 'store'))
+    assert store.manifest() is None and not store.is_current('h', {})
+    store.save(attributes(), 'h', {'stem': False}, figures={'f': {'data': []}})
+    assert store.is_current('h', {'stem': False})
+    assert not store.is_current('other', {'stem': False})
+    assert not store.is_current('h', {'stem': True})
+    attrs = store.load()
+    assert list(attrs['fileid_index']) == ['a.txt', 'b.txt']
+    assert attrs['fileid_i']['b.txt'] == 1
+    assert list(attrs['corpus_words']['a.txt']) == ['nurse', 'ward']
+    assert attrs['corpus_types']['a.txt'] == {'nurse', 'ward'}
+    assert isinstance(attrs['m_coords'], np.memmap)
+    assert np.array_equal(attrs['s_tfidf'].csc.toarray(),
+                          attributes()['s_norm'].toarray())
+    assert attrs['df_counts']['data'] == 1
+    assert attrs['pair'][1] == 'x' and attrs['n_files'] == 2
+    assert store.load_figures() == {'f': {'data': []}}
+
+
+def test_save_keeps_build_being_read(tmp_path):
+    root = str(tmp_path / 'store')
+    store = artifacts.ArtifactStore(root)
+    store.save(attributes(), 'h1', {})
+    reader = artifacts.ArtifactStore(root)
+    m_coords = reader.load()['m_coords']
+    for k in range(2, 4):
+        attrs = attributes()
+        attrs['m_coords'] = attrs['m_coords'] * k
+        artifacts.ArtifactStore(root).save(attrs, 'h{}'.format(k), {})
+    # the arrays mapped before the saves are unchanged, and readers opening
+    # the store now read the last build
+    assert np.array_equal(m_coords, np.arange(6.).reshape(2, 3))
+    assert reader.is_current('h3', {})
+    assert np.array_equal(artifacts.ArtifactStore(root).load()['m_coords'],
+                          np.arange(6.).reshape(2, 3) * 3)
+    # the current and previous builds are kept
+    assert len([name for name in os.listdir(root) if name != 'CURRENT']) == 2
+
+
+def test_documents_round_trip(corpus_id):
+    data = viz.Backend.Data(corpus_id)
+    store = artifacts.ArtifactStore(os.path.join('artifacts', corpus_id))
+    store.save({'documents': data.documents}, 'h', {})
+    documents = store.load()['documents']
+    fileid = '100000003___Staff Nurse.txt'
+    text, next_start = documents.get(fileid)
+    assert text.startswith('The staff nurse') and next_start is None
+    page, next_start = documents.get(fileid, max_bytes=10)
+    assert page == text[:10] and next_start == 10
+    assert documents.get(fileid, start=next_start)[0] == text[10:]
@@ -0,0 +1,41 @@
+import backends
+import viz
+
+
+def test_options_from_environ_match_build_args(monkeypatch):
+    monkeypatch.setenv('WMCHACK_MIN_DF', '3')
+    monkeypatch.setenv('WMCHACK_MAX_DF', '0.9')
+    monkeypatch.setenv('WMCHACK_MAX_FEATURES', '5000')
+    options = backends.options_from_environ()
+    assert (options['min_df'], options['max_df'],
+            options['max_features']) == (3, 0.9, 5000)
+    args = backends.build_args(options)
+    flags = dict(zip(args[::2], args[1::2]))
+    assert viz.df_limit(flags['--min-df']) == 3
+    assert isinstance(viz.df_limit(flags['--max-df']), float)
+    assert flags['--max-features'] == '5000'
+    assert '--ngram-buckets' not in flags
+
+
+def test_default_options_do_not_prune(monkeypatch):
+    for name in ['WMCHACK_MIN_DF', 'WMCHACK_MAX_DF', 'WMCHACK_MAX_FEATURES',
+                 'WMCHACK_NGRAM_BUCKETS', 'WMCHACK_STEM']:
+        monkeypatch.delenv(name, raising=False)
+    options = backends.options_from_environ()
+    assert (options['min_df'], options['max_df'],
+            options['max_features']) == (1, 1.0, None)
+    assert isinstance(options['min_df'], int)
+    assert isinstance(options['max_df'], float)
+    assert not options['stem']
+
+
+def test_stemming_options_from_environ(monkeypatch):
+    monkeypatch.setenv('WMCHACK_STEM', '1')
+    monkeypatch.setenv('WMCHACK_STEM_MEMO', 'memo.json')
+    options = backends.options_from_environ()
+    assert options['stem'] and options['stem_memo_filepath'] == 'memo.json'
+    args = backends.build_args(options)
+    assert args[args.index('--stem') + 1:][:2] == ['--stem-memo', 'memo.json']
+    monkeypatch.setenv('WMCHACK_STEM', '0')
+    assert '--stem' not in backends.build_args(
+        backends.options_from_environ())
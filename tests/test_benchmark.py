@@ -0,0 +1,18 @@
+import benchmark
+
+
+def test_run_pipeline_on_small_corpus(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    benchmark.generate_corpus('synthetic_20', 20, vocab_size=300,
+                              mean_length=40)
+    results = benchmark.run_pipeline('synthetic_20')
+    assert list(results) == ['read_corpus', 'term_frequency', 'tf_idf',
+                             'similar_words', 'jacard_index', 'svd_embedding',
+                             'scatter_pc_tfidf']
+    assert all(costs['wall_s'] >= 0 and costs['peak_mb'] >= 0
+               for costs in results.values())
+    table = benchmark.format_table({'20': results})
+    assert len(table.splitlines()) == 1 + len(results)
+    slower = {'20': {'tf_idf': {'wall_s': results['tf_idf']['wall_s']*2 + 1}}}
+    assert len(benchmark.find_regressions(slower, {'20': results}, 0.25)) == 1
+    assert benchmark.find_regressions({'20': results}, {}, 0.25) == []
@@ -0,0 +1,80 @@
+import callback_cache
+import time
+
+
+def make_cache(tmp_path, version='v1', **kwargs):
+    return callback_cache.CallbackCache(str(tmp_path / 'cache.sqlite'),
+                                        version, **kwargs)
+
+
+def test_memoize_shares_results_and_counts(tmp_path):
+    calls = []
+
+    def square(x):
+        calls.append(x)
+        return x*x
+
+    cache = make_cache(tmp_path)
+    memoized = cache.memoize(square)
+    assert [memoized(3), memoized(3), memoized(4)] == [9, 9, 16]
+    # another worker opening the same file shares entries and counts
+    assert make_cache(tmp_path).memoize(square)(3) == 9
+    assert calls == [3, 4]
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['n_entries']) == (2, 2, 2)
+    assert stats['hit_rate'] == 0.5
+
+
+def test_keys_depend_on_version_and_arguments(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.key('update', ('nurse',))
+    assert key == make_cache(tmp_path).key('update', ('nurse',))
+    assert key != cache.key('update', ('analyst',))
+    assert key != cache.key('other', ('nurse',))
+    cache.put(key, 'table')
+    rebuilt = make_cache(tmp_path, version='v2')
+    assert rebuilt.get(rebuilt.key('update', ('nurse',))) == (False, None)
+
+
+def test_expired_entries_miss(tmp_path):
+    cache = make_cache(tmp_path, ttl_s=0.05)
+    cache.put('k', 1)
+    assert cache.get('k') == (True, 1)
+    time.sleep(0.1)
+    assert cache.get('k') == (False, None)
+    cache.put('other', 2) # deletes expired entries
+    assert cache.stats()['n_entries'] == 1
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, max_mb=2500/2**20)
+    for key in ['a', 'b', 'c']:
+        cache.put(key, b'x'*1000)
+        time.sleep(0.01)
+    # 3 entries exceed 2,500 bytes, so the least recently used one goes
+    assert cache.get('a') == (False, None)
+    cache.get('b')
+    time.sleep(0.01)
+    cache.put('d', b'x'*1000)
+    assert cache.get('b')[0] and cache.get('d')[0]
+    assert cache.get('c') == (False, None)
+
+
+def test_peek_does_not_count(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.peek('k') == (False, None)
+    cache.put('k', 1)
+    assert cache.peek('k') == (True, 1)
+    cache.count(False)
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (0, 1)
+
+
+def test_entries_with_shorter_ttl_expire_first(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put('error', 'failed', ttl_s=0.05)
+    cache.put('result', 'table')
+    assert cache.peek('error') == (True, 'failed')
+    time.sleep(0.1)
+    assert cache.peek('error') == (False, None)
+    assert cache.peek('result') == (True, 'table')
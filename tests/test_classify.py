@@ -0,0 +1,51 @@
+import classify
+import viz
+import numpy as np
+import os
+import pandas as pd
+
+
+def fitted_classifier(corpus_id):
+    data = viz.Backend.Data(corpus_id)
+    labels = pd.Series({fid: 'analyst' if 'Analyst' in fid else 'clinical'
+                        for fid in data.fileid_index})
+    return data, classify.RoleClassifier(data).fit(data, labels)
+
+
+def test_vectorize_matches_corpus_tfidf(corpus_id):
+    data, clf = fitted_classifier(corpus_id)
+    fileid = '100000003___Staff Nurse.txt'
+    with open(os.path.join(corpus_id, fileid), encoding='utf-8') as f:
+        X = clf.vectorize([f.read()])
+    expected = data.s_tfidf_norm[[data.fileid_i[fileid]]]
+    assert np.allclose(X.toarray(), expected.toarray(), atol=1e-6)
+
+
+def test_vectorize_description_without_known_tokens(corpus_id):
+    _, clf = fitted_classifier(corpus_id)
+    X = clf.vectorize(['', 'zzzqqq', 'the nurse'])
+    assert X.shape == (3, clf.n_tokens)
+    assert X[0].nnz == 0 and X[1].nnz == 0 and X[2].nnz == 1
+
+
+def test_predict_keeps_batch_with_unknown_descriptions(corpus_id):
+    _, clf = fitted_classifier(corpus_id)
+    descriptions = ['zzzqqq', 'senior data analyst reports', '']
+    df = pd.concat(clf.predict(descriptions, batch_size=2))
+    assert len(df) == 3
+    assert df['label'].iloc[1] == 'analyst'
+
+
+def test_ngram_features_of_new_descriptions_match_corpus(corpus_id):
+    data = viz.Backend.Data(corpus_id, ngram_buckets=64)
+    labels = pd.Series({fid: 'analyst' if 'Analyst' in fid else 'clinical'
+                        for fid in data.fileid_index})
+    clf = classify.RoleClassifier(data).fit(data, labels)
+    X_corpus = clf.features(data)
+    assert X_corpus.shape == (len(data.fileid_index), clf.n_tokens + 64)
+    fileid = '100000001___Data Analyst.txt'
+    with open(os.path.join(corpus_id, fileid), encoding='utf-8') as f:
+        X = clf.vectorize([f.read(), 'zzzqqq'])
+    assert np.allclose(X[0].toarray(),
+                       X_corpus[data.fileid_i[fileid]].toarray(), atol=1e-6)
+    assert X[1].nnz == 0
@@ -0,0 +1,44 @@
+import analysis as an
+import doc_cache
+import os
+import time
+
+FILEID = '100000003___Staff Nurse.txt'
+
+
+def read(corpus_id):
+    with doc_cache.DocumentCache('doc_cache.sqlite',
+                                 an.NORMALIZER_VERSION) as cache:
+        corpus_raw, corpus_words = an.read_corpus_cached(corpus_id, cache)
+        return corpus_words, (cache.n_hits, cache.n_misses)
+
+
+def test_only_edited_file_is_tokenized_again(corpus_id):
+    corpus_words, counts = read(corpus_id)
+    assert counts == (0, 5)
+    assert corpus_words == an.get_corpus_words(an.read_corpus(corpus_id))
+    with open(os.path.join(corpus_id, FILEID), 'a', encoding='utf-8') as f:
+        f.write(' Night shifts.')
+    corpus_words, counts = read(corpus_id)
+    assert counts == (4, 1)
+    assert corpus_words[FILEID][-2:] == ['night', 'shifts']
+    assert corpus_words == an.get_corpus_words(an.read_corpus(corpus_id))
+
+
+def test_eviction_drops_tokens_of_evicted_entries(tmp_path):
+    filepath = str(tmp_path / 'doc_cache.sqlite')
+    with doc_cache.DocumentCache(filepath, 'v') as cache:
+        cache.put('old', ['staff', 'nurse'], ['nurse'])
+        cache.commit()
+        time.sleep(0.01) # so that 'old' is least recently used
+        cache.put('new', ['data', 'analyst'], ['analyst'])
+        # the vocabulary counts towards the cap
+        cache.max_bytes = cache.nbytes() - 1
+    with doc_cache.DocumentCache(filepath, 'v') as cache:
+        assert cache.get('old') is None
+        assert cache.get('new') == (['data', 'analyst'], ['analyst'])
+        assert set(cache.vocab_i) == {'data', 'analyst'}
+        # ids of evicted tokens are not reused
+        cache.put('other', ['nurse'], ['nurse'])
+        assert cache.vocab_i['nurse'] == 4
+        assert cache.get('other') == (['nurse'], ['nurse'])
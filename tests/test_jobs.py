@@ -0,0 +1,78 @@
+import callback_cache
+import jobs
+import viz
+import os
+import time
+
+OPTIONS = {'n_neighbours': 3}
+PAIR = ('100000003___Staff Nurse.txt', '100000004___Community Nurse.txt')
+
+
+def build_store(corpus_id):
+    viz.Backend.load_or_build(corpus_id, os.path.join('artifacts', corpus_id),
+                              background=False, **OPTIONS)
+
+
+def start_runner(corpus_id, **kwargs):
+    cache = callback_cache.CallbackCache('callback_cache.sqlite', 'test')
+    return jobs.start_runner(cache, [corpus_id], n_jobs=1, **OPTIONS,
+                             **kwargs)
+
+
+def request(runner, corpus_id, version='v1', poll=False):
+    return runner.result('jacard_figure', version, (corpus_id,) + PAIR,
+                         jobs.jacard_figure, poll=poll)
+
+
+def wait(runner, corpus_id, version='v1', timeout_s=120):
+    # poll as the page does until the job is done or failed
+    start = time.time()
+    while time.time() - start < timeout_s:
+        job = request(runner, corpus_id, version, poll=True)
+        if job.status != 'running':
+            return job
+        time.sleep(0.1)
+    raise TimeoutError
+
+
+def test_job_runs_once_and_serves_stale_result(corpus_id):
+    build_store(corpus_id)
+    runner = start_runner(corpus_id)
+    other_worker = start_runner(corpus_id)
+    try:
+        job = request(runner, corpus_id)
+        assert job.status == 'running' and job.value is None
+        # the key is claimed, so another worker does not submit it again
+        assert request(other_worker, corpus_id).status == 'running'
+        assert other_worker.n_running() == 0
+        job = wait(runner, corpus_id)
+        assert job.status == 'done'
+        assert sorted(job.value['data'][0]['hovertext']) == sorted(
+            viz.Backend.Data(corpus_id).fileid_index)
+        assert request(other_worker, corpus_id) == job
+        # a new version is computed while the previous one is served
+        stale = request(runner, corpus_id, version='v2')
+        assert stale.status == 'running' and stale.value == job.value
+        assert wait(runner, corpus_id, version='v2').status == 'done'
+    finally:
+        runner.pool.shutdown()
+    # one miss per version requested, and one hit; polls are not counted
+    stats = runner.cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 3)
+
+
+def test_job_fails_without_store_and_is_retried(corpus_id):
+    runner = start_runner(corpus_id, failure_ttl_s=0.5)
+    try:
+        request(runner, corpus_id)
+        job = wait(runner, corpus_id)
+        assert job.status == 'failed'
+        assert job.value.startswith('ValueError') and 'viz.py' in job.value
+        # the pool process did not build the store
+        assert not os.path.exists(os.path.join('artifacts', corpus_id))
+        build_store(corpus_id)
+        time.sleep(0.5)
+        assert request(runner, corpus_id).status == 'running'
+        assert wait(runner, corpus_id).status == 'done'
+    finally:
+        runner.pool.shutdown()
@@ -0,0 +1,86 @@
+import metrics
+from dash.exceptions import PreventUpdate
+import os
+import pytest
+import re
+
+
+def make_metrics(tmp_path):
+    return metrics.Metrics(str(tmp_path / 'metrics.sqlite'),
+                           buckets=(0.1, 1.))
+
+
+def samples(text, name):
+    # {labels: value} of the samples of name in rendered text
+    return {labels: float(value) for labels, value in re.findall(
+                r'^' + name + r'\{(.*)\} (\S+)$', text, re.MULTILINE)}
+
+
+def test_histogram_renders_every_bucket(tmp_path):
+    m = make_metrics(tmp_path)
+    m.observe('dash_callback_latency_seconds', {'callback': 'slow'}, 5.)
+    m.observe('dash_callback_latency_seconds', {'callback': 'fast'}, 0.05)
+    m.observe('dash_callback_latency_seconds', {'callback': 'fast'}, 0.5)
+    text = m.render()
+    buckets = samples(text, 'dash_callback_latency_seconds_bucket')
+    assert buckets == {'callback="fast",le="0.1"': 1,
+                       'callback="fast",le="1"': 2,
+                       'callback="fast",le="+Inf"': 2,
+                       'callback="slow",le="0.1"': 0,
+                       'callback="slow",le="1"': 0,
+                       'callback="slow",le="+Inf"': 1}
+    assert samples(text, 'dash_callback_latency_seconds_count') == {
+        'callback="fast"': 2, 'callback="slow"': 1}
+    assert samples(text, 'dash_callback_latency_seconds_sum')[
+        'callback="fast"'] == pytest.approx(0.55)
+    # buckets are listed in increasing order of le, after the family's type
+    lines = text.splitlines()
+    assert lines.index('# TYPE dash_callback_latency_seconds histogram') < \
+        lines.index('dash_callback_latency_seconds_bucket'
+                    '{callback="fast",le="0.1"} 1') < \
+        lines.index('dash_callback_latency_seconds_bucket'
+                    '{callback="fast",le="+Inf"} 2')
+
+
+def test_timed_counts_errors_but_not_prevented_updates(tmp_path):
+    m = make_metrics(tmp_path)
+
+    def update(value):
+        if value is None:
+            raise PreventUpdate
+        return 1/value
+
+    timed = m.timed(update)
+    assert timed(2) == 0.5
+    for value in [None, 0]:
+        with pytest.raises((PreventUpdate, ZeroDivisionError)):
+            timed(value)
+    text = m.render()
+    assert samples(text, 'dash_callback_errors_total') == {
+        'callback="update"': 1}
+    assert samples(text, 'dash_callback_latency_seconds_count') == {
+        'callback="update"': 3}
+
+
+def test_workers_sharing_file_report_totals(tmp_path):
+    workers = [make_metrics(tmp_path), make_metrics(tmp_path)]
+    for k, m in enumerate(workers):
+        m.describe('worker_rss_bytes', 'gauge', 'RSS of a worker.')
+        m.collector(lambda k=k: [('worker_rss_bytes', {}, 100.*(k + 1))],
+                    per_process=True)
+        m.inc('dash_callback_errors_total', {'callback': 'update'})
+    workers[1].flush()
+    text = workers[0].render()
+    assert samples(text, 'dash_callback_errors_total') == {
+        'callback="update"': 2}
+    # per-process samples are labelled with the pid of the process, and
+    # replaced by its last flush
+    assert samples(text, 'worker_rss_bytes') == {
+        'pid="{}"'.format(os.getpid()): 100.}
+
+
+def test_label_values_are_escaped():
+    assert metrics.format_labels({'callback': 'a"b\\c\nd', 'le': 0.5}) == \
+        'callback="a\\"b\\\\c\\nd",le="0.5"'
+    assert metrics.format_value(float('inf')) == '+Inf'
+    assert metrics.format_value(2.0) == '2'
@@ -0,0 +1,43 @@
+import phrases
+import numpy as np
+import scipy.sparse as sps
+
+
+def write_dictionary(tmp_path):
+    filepath = tmp_path / 'phrases.csv'
+    filepath.write_text('phrase,group\n'
+                        'Data Analyst,FEDIP\n'
+                        'data analyst,GSS\n'
+                        'data  analyst,GSS\n'
+                        'statistician,GSS\n'
+                        'bi,FEDIP\n', encoding='utf-8')
+    return str(filepath)
+
+
+def test_matcher_counts_phrases_on_word_boundaries():
+    matcher = phrases.PhraseMatcher(['data analyst', 'analyst', 'bi'])
+    counts = matcher.count('senior data analyst in biology, bi and analyst')
+    assert counts == {0: 1, 1: 2, 2: 1}
+
+
+def test_phrase_in_several_groups_counts_in_each(tmp_path):
+    df_phrases = phrases.load_phrase_dictionary(write_dictionary(tmp_path))
+    assert len(df_phrases) == 4 # repeated (phrase, group) rows dropped
+    matcher = phrases.PhraseMatcher(df_phrases['phrase'])
+    assert matcher.phrases == ['data analyst', 'statistician', 'bi']
+
+    texts = ['data analyst and statistician', 'bi data analyst', 'nurse']
+    m_hits = sps.csr_matrix(np.array(
+        [[matcher.count(t)[j] for j in range(len(matcher.phrases))]
+         for t in texts]))
+    m_group_hits, groups = phrases.group_hits(m_hits, matcher.phrases,
+                                              df_phrases)
+    assert groups == ['FEDIP', 'GSS']
+    assert m_group_hits.toarray().tolist() == [[1, 2], [2, 1], [0, 0]]
+
+
+def test_match_corpus_matches_serial_counts(tmp_path):
+    matcher = phrases.PhraseMatcher(['data analyst', 'statistician'])
+    texts = ['data analyst', 'statistician statistician', '']
+    m_hits = phrases.match_corpus(matcher, texts, n_jobs=1, chunksize=1)
+    assert m_hits.toarray().tolist() == [[1, 0], [0, 2], [0, 0]]
@@ -0,0 +1,51 @@
+import profiling
+import viz
+import json
+import os
+import tracemalloc
+
+
+def test_nested_stages_leave_tracing_to_outer_stage():
+    prof = profiling.StageProfiler()
+    with prof.stage('outer'):
+        outer = bytearray(2**22)
+        with prof.stage('inner'):
+            inner = bytearray(2**23)
+        # the inner stage did not stop tracing the outer one
+        assert tracemalloc.is_tracing()
+        del inner
+    del outer
+    assert not tracemalloc.is_tracing()
+    assert prof.stages['inner']['traced_peak_mb'] >= 8
+    assert prof.stages['outer']['traced_peak_mb'] >= 12
+    assert prof.stages['outer']['traced_net_mb'] >= 4
+
+
+def test_stage_keeps_tracing_started_by_caller():
+    tracemalloc.start()
+    try:
+        prof = profiling.StageProfiler()
+        with prof.stage('small'):
+            pass
+        assert tracemalloc.is_tracing()
+        # below the caller's peak, so the stage's own peak is not known
+        big = bytearray(2**23)
+        del big
+        with prof.stage('small'):
+            pass
+        assert prof.stages['small']['traced_peak_mb'] is None
+    finally:
+        tracemalloc.stop()
+
+
+def test_profile_rebuilds_current_store(corpus_id):
+    artifact_dir = os.path.join('artifacts', corpus_id)
+    viz.Backend.load_or_build(corpus_id, artifact_dir, background=False)
+    assert not os.path.exists(corpus_id + '_profile.json')
+    be = viz.Backend.load_or_build(corpus_id, artifact_dir, background=False,
+                                   rebuild=True, profile=True)
+    with open(corpus_id + '_profile.json') as f:
+        report = json.load(f)
+    assert {'read_corpus', 'token_associations'} <= set(report['stages'])
+    # the profile is not part of the store key
+    assert viz.Backend.load(corpus_id, artifact_dir).version == be.version
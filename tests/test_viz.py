@@ -0,0 +1,77 @@
+import viz
+import os
+import pytest
+
+
+def test_static_figures_of_corpus_without_uk_files(corpus_id):
+    be = viz.Backend.load_or_build(corpus_id,
+                                   os.path.join('artifacts', corpus_id),
+                                   background=False)
+    assert sorted(be.figures) == sorted(viz.STATIC_FIGURES)
+    pair = viz.default_jacard_pair(be.data)
+    assert pair == ('100000001___Data Analyst.txt',
+                    '100000002___Senior Data Analyst.txt')
+    # a worker loading the store reads the same prerendered figures
+    loaded = viz.Backend.load_or_build(corpus_id,
+                                       os.path.join('artifacts', corpus_id))
+    assert loaded.figure('scatter_jacard') == be.figures['scatter_jacard']
+    hovertext = loaded.figures['scatter_jacard']['data'][0]['hovertext']
+    assert sorted(hovertext) == sorted(be.data.fileid_index)
+
+
+def test_scatter_jacard_fills_in_missing_file(corpus_id):
+    data = viz.Backend.Data(corpus_id)
+    fig = viz.Backend.Viz.Graph().scatter_jacard(
+        data, fileid_1='100000003___Staff Nurse.txt')
+    points = fig.data[0]
+    i = list(points.hovertext).index('100000003___Staff Nurse.txt')
+    j = list(points.hovertext).index('100000002___Senior Data Analyst.txt')
+    assert points.x[i] == 1 and points.y[j] == 1
+
+
+def test_pruned_build_round_trips(corpus_id):
+    options = {'n_neighbours': 2, 'min_df': 2, 'max_df': 0.5}
+    artifact_dir = os.path.join('artifacts', corpus_id)
+    built = viz.Backend.load_or_build(corpus_id, artifact_dir,
+                                      background=False, **options)
+    # tokens in 2 of the 5 files: analyst's variants, data, managers, ...
+    assert built.data.pruning_report['n_tokens_after'] == len(
+        built.data.token_index) < built.data.pruning_report['n_tokens_before']
+    for loaded in [viz.Backend.load_or_build(corpus_id, artifact_dir,
+                                             **options),
+                   viz.Backend.load(corpus_id, artifact_dir, **options)]:
+        assert list(loaded.data.token_index) == list(built.data.token_index)
+        assert loaded.data.pruning_report == built.data.pruning_report
+        assert loaded.data.s_tfidf.shape == built.data.s_tfidf.shape
+        assert loaded.version == built.version
+    # a store pruned with other limits is stale
+    with pytest.raises(ValueError):
+        viz.Backend.load(corpus_id, artifact_dir, **dict(options, min_df=1))
+    with pytest.raises(ValueError):
+        viz.Backend.load(corpus_id, artifact_dir, **dict(options, max_df=2))
+
+
+def test_stem_memo_is_not_part_of_store_key(corpus_id):
+    artifact_dir = os.path.join('artifacts', corpus_id)
+    built = viz.Backend.load_or_build(corpus_id, artifact_dir,
+                                      background=False, stem=True,
+                                      stem_memo_filepath='stem_memo.json')
+    assert os.path.exists('stem_memo.json')
+    assert built.data.token_i['nurses'] == built.data.token_i['nurse']
+    # moving the memo does not make the store stale
+    os.rename('stem_memo.json', 'moved_memo.json')
+    loaded = viz.Backend.load(corpus_id, artifact_dir, stem=True,
+                              stem_memo_filepath='moved_memo.json')
+    assert loaded.version == built.version
+    with pytest.raises(ValueError):
+        viz.Backend.load(corpus_id, artifact_dir, stem=False,
+                         stem_memo_filepath='moved_memo.json')
+
+
+def test_token_suggestions_do_not_build_associations(corpus_id):
+    data = viz.Backend.Data(corpus_id)
+    options = viz.Backend.Viz.Table().token_suggestions(data, 'nurse')
+    assert [o.value for o in options] == ['nurse', 'nurses']
+    options = viz.Backend.Viz.Table().token_suggestions(data, 'pa')
+    assert options[0].value == 'patients' # in 3 files
+    assert 'token_assoc' not in data.public_attributes()